@@ -1,152 +1,412 @@
 # anomalies.py
 
+import json
+import numpy as np
 import pandas as pd
-import sqlite3
+from crime_db import connect_reader, count_by_day, load_crimes, load_daily_counts
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from sklearn.ensemble import IsolationForest
 import folium
 from folium.plugins import MarkerCluster
-import geopandas as gpd
+from beat_boundaries import add_beat_layer
+from profiling import profiled, stage
 import webbrowser
 import os
+import threading
 
-# Connect to the SQLite database
-db_path = 'crime_data.db'  # Replace with your actual path
-conn = sqlite3.connect(db_path)
-
-# Load the data from the 'crimes' table
-crimes_df = pd.read_sql_query("SELECT * FROM crimes", conn)
-
-# Feature Engineering: Extract date components and aggregate data by date
-crimes_df['date'] = pd.to_datetime(crimes_df['date'])
-crime_counts = crimes_df.groupby('date').size().reset_index(name='count')
-
-# Train Isolation Forest Model
-model = IsolationForest(contamination=0.01, random_state=42)
-crime_counts['anomaly'] = model.fit_predict(crime_counts[['count']])
-
-# Separate high anomalies
-high_anomalies = crime_counts[(crime_counts['anomaly'] == -1) & (crime_counts['count'] > crime_counts['count'].mean())]
-
-# Functions to plot each subplot
-def plot_high_anomalies(ax):
-    ax.plot(crime_counts['date'], crime_counts['count'], label='Daily Crime Counts', color='blue')
-    ax.scatter(high_anomalies['date'], high_anomalies['count'], color='red', label='High Anomalies')
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Number of Crimes')
-    ax.set_title('High Anomalies in Daily Crime Counts')
-    ax.legend()
-
-def plot_monthly_anomalies(ax):
-    anomalies_df = pd.merge(crimes_df, crime_counts, on='date')
-    high_anomalies_df = anomalies_df[(anomalies_df['anomaly'] == -1) & (anomalies_df['count'] > anomalies_df['count'].mean())]
-    high_anomalies_df['month'] = high_anomalies_df['date'].dt.month
-    monthly_anomalies = high_anomalies_df['month'].value_counts().sort_index().reset_index()
-    monthly_anomalies.columns = ['month', 'count']
-    ax.bar(monthly_anomalies['month'], monthly_anomalies['count'], color='skyblue')
-    ax.set_xlabel('Month')
-    ax.set_ylabel('Number of Anomalies')
-    ax.set_title('Monthly Anomalies')
-    ax.set_xticks(range(1, 13))
-    ax.set_xticklabels(['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'])
-
-def plot_weekly_anomalies(ax):
-    anomalies_df = pd.merge(crimes_df, crime_counts, on='date')
-    high_anomalies_df = anomalies_df[(anomalies_df['anomaly'] == -1) & (anomalies_df['count'] > anomalies_df['count'].mean())]
-    high_anomalies_df['day_of_week'] = high_anomalies_df['date'].dt.dayofweek
-    weekly_anomalies = high_anomalies_df['day_of_week'].value_counts().sort_index().reset_index()
-    weekly_anomalies.columns = ['day_of_week', 'count']
-    ax.bar(weekly_anomalies['day_of_week'], weekly_anomalies['count'], color='salmon')
-    ax.set_xlabel('Day of the Week')
-    ax.set_ylabel('Number of Anomalies')
-    ax.set_title('Weekly Anomalies')
-    ax.set_xticks(range(7))
-    ax.set_xticklabels(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
-
-def plot_crime_type_anomalies(ax):
-    anomalies_df = pd.merge(crimes_df, crime_counts, on='date')
-    high_anomalies_df = anomalies_df[(anomalies_df['anomaly'] == -1) & (anomalies_df['count'] > anomalies_df['count'].mean())]
-    crime_type_anomalies = high_anomalies_df['primary_type'].value_counts().reset_index()
-    crime_type_anomalies.columns = ['Crime Type', 'Count']
-    ax.bar(crime_type_anomalies['Crime Type'], crime_type_anomalies['Count'], color='purple', alpha=0.7)
-    ax.set_xlabel('Crime Type')
-    ax.set_ylabel('Number of Anomalies')
-    ax.set_title('Anomalies by Crime Type')
-    ax.set_xticklabels(crime_type_anomalies['Crime Type'], rotation=90)
-
-# Function to detect anomalies and plot them
-def detect_anomalies():
-    # Visualize high anomalies
-    fig, axs = plt.subplots(2, 2, figsize=(21, 14))  # Adjusted size
-
-    plot_high_anomalies(axs[0, 0])
-    plot_monthly_anomalies(axs[0, 1])
-    plot_weekly_anomalies(axs[1, 0])
-    plot_crime_type_anomalies(axs[1, 1])
-
-    plt.tight_layout()
-    plt.savefig('anomalies_analysis.png')
-    plt.show()
-
-    anomalies_df = pd.merge(crimes_df, crime_counts, on='date')
-    high_anomalies_df = anomalies_df[(anomalies_df['anomaly'] == -1) & (anomalies_df['count'] > anomalies_df['count'].mean())]
-    high_anomalies_locations = high_anomalies_df[['latitude', 'longitude', 'primary_type', 'date', 'location_description', 'time']]
-
-    # Convert latitude and longitude to numeric, handling errors
-    high_anomalies_locations['latitude'] = pd.to_numeric(high_anomalies_locations['latitude'], errors='coerce')
-    high_anomalies_locations['longitude'] = pd.to_numeric(high_anomalies_locations['longitude'], errors='coerce')
-
-    # Drop rows with invalid latitude or longitude values
-    high_anomalies_locations.dropna(subset=['latitude', 'longitude'], inplace=True)
-
-    # Load the shape files for beat boundaries
-    shapefile_path = 'boundaries/geo_export_0b908a58-99fc-452e-866d-07ad3860c3ca.shp'
-    gdf = gpd.read_file(shapefile_path)
-
-    # Create a base map
-    map_center = [high_anomalies_locations['latitude'].mean(), high_anomalies_locations['longitude'].mean()]
-    crime_map = folium.Map(location=map_center, zoom_start=11)
-
-    # Add beat boundaries to the map
-    folium.GeoJson(gdf).add_to(crime_map)
-
-    # Add a marker cluster to the map
-    marker_cluster = MarkerCluster().add_to(crime_map)
-
-    # Add markers to the map with popups showing relevant details
-    for idx, row in high_anomalies_locations.iterrows():
-        popup_text = f"""
-        <b>Crime Type:</b> {row['primary_type']}<br>
-        <b>Date:</b> {row['date'].date()}<br>
-        <b>Location:</b> {row['location_description']}<br>
-        <b>Time:</b> {row['time']}
-        """
-        folium.Marker(
-            location=[row['latitude'], row['longitude']],
-            popup=popup_text
-        ).add_to(marker_cluster)
-
-    # Save the map to an HTML file
-    map_path = 'crime_anomalies_map.html'  # Replace with your desired path
-    crime_map.save(map_path)
-
-    # Automatically open the HTML file in the default web browser
-    webbrowser.open('file://' + os.path.realpath(map_path))
-
-    print(f"Crime anomalies map saved to {map_path}")
+# Dense (series x day) count matrix from long daily counts with one row per group and day.
+# Returns the group keys of each row, the calendar days of each column and the float32 counts,
+# with zeros on days a group had no incidents.
+def count_matrix(counts, by):
+    series = counts.groupby(by, sort=True, dropna=False, observed=True).ngroup().to_numpy()
+    keys = counts[by].drop_duplicates().sort_values(by).reset_index(drop=True)
+    dates = pd.date_range(counts['date'].min(), counts['date'].max(), freq='D')
+    day = ((counts['date'] - dates[0]) // pd.Timedelta(days=1)).to_numpy()
+    matrix = np.zeros((len(keys), len(dates)), dtype='float32')
+    matrix[series, day] = counts['count'].to_numpy()
+    return keys, dates, matrix
+
+# Median along the last axis. Sorting short windows is several times faster than np.median's
+# partition on strided views.
+def sorted_median(windows):
+    ordered = np.sort(windows, axis=-1)
+    middle = windows.shape[-1] // 2
+    return (ordered[..., middle] + ordered[..., (windows.shape[-1] - 1) // 2]) / 2
+
+# Median and median absolute deviation of the periods observations before each day, taken step
+# days apart (step=7 compares a day with the same weekday in earlier weeks). Computed with strided
+# windows over blocks of series, so all series are handled by a few numpy calls. Days without a
+# full window of history get NaN.
+def trailing_median(matrix, periods, step=1, block_size=4000000):
+    span = periods * step
+    median = np.full(matrix.shape, np.nan, dtype='float32')
+    mad = np.full(matrix.shape, np.nan, dtype='float32')
+    if matrix.shape[1] <= span:
+        return median, mad
+    windows = np.lib.stride_tricks.sliding_window_view(matrix[:, :-1], span, axis=1)[..., ::step]
+    rows = max(1, block_size // (windows.shape[1] * periods))
+    for first in range(0, len(matrix), rows):
+        block = windows[first:first + rows]
+        block_median = sorted_median(block)
+        median[first:first + rows, span:] = block_median
+        mad[first:first + rows, span:] = sorted_median(np.abs(block - block_median[..., None]))
+    return median, mad
+
+# Robust z-scores of every day of every series against two trailing baselines: the previous
+# window days, and the same weekday over the previous seasonal_weeks weeks. Spread is the
+# baseline's median absolute deviation, floored at its Poisson noise so quiet series are not
+# flagged for a handful of incidents. Also returns the seasonal baseline as the expected count.
+def robust_scores(matrix, window=28, seasonal_weeks=8):
+    def zscore(median, mad):
+        scale = np.maximum(1.4826 * mad, np.sqrt(np.maximum(median, 1)))
+        return (matrix - median) / scale
+
+    median, mad = trailing_median(matrix, window)
+    seasonal_median, seasonal_mad = trailing_median(matrix, seasonal_weeks, step=7)
+    return zscore(median, mad), zscore(seasonal_median, seasonal_mad), seasonal_median
+
+# IsolationForest score of the given (series, day) cells, higher meaning more anomalous. One
+# forest is fitted across all series on a sample of cells, each described by the seasonal
+# z-scores of its last feature_window days, so it learns what a normal recent shape looks like.
+def isolation_scores(z_seasonal, series, day, feature_window=7, n_jobs=None, random_state=42, max_fit_rows=200000):
+    windows = np.lib.stride_tricks.sliding_window_view(np.nan_to_num(z_seasonal), feature_window, axis=1)
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(windows.shape[0] * windows.shape[1], min(windows.shape[0] * windows.shape[1], max_fit_rows), replace=False)
+    model = IsolationForest(n_jobs=n_jobs, random_state=random_state)
+    model.fit(windows[sample // windows.shape[1], sample % windows.shape[1]])
+    return -model.score_samples(windows[series, np.maximum(day - feature_window + 1, 0)])
+
+# Flagged (series, day) cells of a scored matrix with their counts, baselines and z-scores.
+# A cell is flagged when its count is at least min_count and it stands out against both the
+# recent level and the usual level for its weekday (score is the smaller of the two robust
+# z-scores, so days without enough history for both are not scored).
+def flagged_cells(keys, dates, matrix, z_rolling, z_seasonal, expected, threshold, min_count):
+    score = np.minimum(z_rolling, z_seasonal)
+    series, day = np.nonzero((score >= threshold) & (matrix >= min_count))
+    cells = keys.iloc[series].reset_index(drop=True)
+    cells['date'] = dates[day]
+    cells['count'] = matrix[series, day].astype('int64')
+    cells['expected'] = expected[series, day]
+    cells['z_rolling'] = z_rolling[series, day]
+    cells['z_seasonal'] = z_seasonal[series, day]
+    cells['score'] = score[series, day]
+    return cells, series, day
+
+# Ranked table of anomalous (series, day) cells over the whole history. With isolation_forest the
+# flagged cells are ranked by IsolationForest score instead of the robust score.
+@profiled('anomalies.score_series', rows_in=lambda counts, *args, **kwargs: len(counts), rows_out=len)
+def score_series(counts, by, window=28, seasonal_weeks=8, threshold=3.5, min_count=3, isolation_forest=False, n_jobs=None, random_state=42, top=None):
+    keys, dates, matrix = count_matrix(counts, by)
+    z_rolling, z_seasonal, expected = robust_scores(matrix, window, seasonal_weeks)
+    ranked, series, day = flagged_cells(keys, dates, matrix, z_rolling, z_seasonal, expected, threshold, min_count)
+    rank_by = 'score'
+    if isolation_forest:
+        ranked['isolation_score'] = isolation_scores(z_seasonal, series, day, n_jobs=n_jobs, random_state=random_state)
+        rank_by = 'isolation_score'
+    ranked = ranked.sort_values(rank_by, ascending=False, ignore_index=True)
+    return ranked.head(top) if top else ranked
+
+# Scores only the days ingested since its last run. Between runs it keeps, per series, the counts
+# of the trailing days the robust baselines need, so an update reads just the new days from the
+# database and gives the same scores as score_series over the full history. The state is a JSON
+# file next to the database, one per grouping. The most recent day is re-scored on the next run
+# because it may have been only partly ingested; rows added later to older days are not re-scored.
+class OnlineAnomalyScorer:
+    def __init__(self, db_path='crime_data.db', by=('district', 'primary_type'), window=28, seasonal_weeks=8, threshold=3.5, min_count=3, state_path=None):
+        self.db_path = db_path
+        self.by = list(by)
+        self.window = window
+        self.seasonal_weeks = seasonal_weeks
+        self.threshold = threshold
+        self.min_count = min_count
+        self.state_path = state_path or f"{os.path.splitext(db_path)[0]}_anomalies_{'-'.join(self.by)}.json"
+        # Days of history needed before a day can be scored
+        self.history_days = max(window, 7 * seasonal_weeks)
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state['window'] != self.window or state['seasonal_weeks'] != self.seasonal_weeks:
+            return None
+        return state
+
+    def save_state(self, next_day, keys, history):
+        state = {
+            'window': self.window,
+            'seasonal_weeks': self.seasonal_weeks,
+            'next_day': next_day,
+            'keys': keys.astype(object).where(keys.notna(), None).values.tolist(),
+            'history': history.astype('int64').tolist(),
+        }
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    # Forget the saved state, e.g. after the database has been rebuilt
+    def reset(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    # State for a first run: history for the days before the latest day in the database
+    def initial_state(self):
+        conn = connect_reader(self.db_path)
+        latest = conn.execute("SELECT MAX(day) FROM daily_counts").fetchone()[0]
+        conn.close()
+        if latest is None:
+            return None
+        counts = load_daily_counts(self.db_path, start=pd.to_datetime(latest - self.history_days, unit='D'), end=pd.to_datetime(latest, unit='D'), by=self.by)
+        return {'next_day': latest, 'keys': counts[self.by].drop_duplicates().values.tolist(), 'history': None, 'counts': counts}
+
+    # Score the days since the last run, save the new state and return the flagged cells ranked by score
+    @profiled('anomalies.online_update', rows_out=len)
+    def update(self):
+        state = self.load_state() or self.initial_state()
+        if state is None:
+            return pd.DataFrame(columns=self.by + ['date', 'count', 'expected', 'z_rolling', 'z_seasonal', 'score'])
+        first_day = pd.to_datetime(state['next_day'], unit='D')
+        history_dates = pd.date_range(end=first_day - pd.Timedelta(days=1), periods=self.history_days, freq='D')
+        counts = load_daily_counts(self.db_path, start=first_day, by=self.by)
+        if 'counts' in state:
+            counts = pd.concat([state['counts'], counts], ignore_index=True)
+
+        # Series keys in state order, then any series seen for the first time
+        keys = pd.DataFrame(state['keys'], columns=self.by)
+        new_keys = counts[self.by].drop_duplicates()
+        keys = pd.concat([keys, new_keys], ignore_index=True).astype(object)
+        keys = keys.where(keys.notna(), None).drop_duplicates(ignore_index=True)
+        index = {key: i for i, key in enumerate(keys.itertuples(index=False, name=None))}
+
+        last_date = max(counts['date'].max(), first_day) if len(counts) else first_day
+        dates = pd.date_range(history_dates[0], last_date, freq='D')
+        matrix = np.zeros((len(keys), len(dates)), dtype='float32')
+        if state['history'] is not None:
+            matrix[:len(state['history']), :self.history_days] = np.asarray(state['history'], dtype='float32').reshape(-1, self.history_days)
+        count_keys = counts[self.by].astype(object)
+        series = [index[key] for key in count_keys.where(count_keys.notna(), None).itertuples(index=False, name=None)]
+        matrix[series, ((counts['date'] - dates[0]) // pd.Timedelta(days=1)).to_numpy()] = counts['count'].to_numpy()
+
+        z_rolling, z_seasonal, expected = robust_scores(matrix, self.window, self.seasonal_weeks)
+        new = slice(self.history_days, None)
+        ranked, _, _ = flagged_cells(keys, dates[new], matrix[:, new], z_rolling[:, new], z_seasonal[:, new], expected[:, new], self.threshold, self.min_count)
+
+        next_day = int((dates[-1] - pd.Timestamp(0)) // pd.Timedelta(days=1))
+        self.save_state(next_day, keys, matrix[:, -self.history_days - 1:-1])
+        return ranked.sort_values('score', ascending=False, ignore_index=True)
+
+# Detects days with unusually many crimes and renders the anomaly plots and map.
+# Nothing is read from the database until a result is first needed; the daily counts, the fitted
+# anomaly labels and the incidents on anomalous days are then cached until refresh() is called.
+# With crimes (incidents already loaded, with timestamp, datetime, primary_type,
+# location_description, latitude and longitude) everything is taken from them instead.
+# The caches are filled and dropped under a lock, so one detector can be shared by threads.
+class AnomalyDetector:
+    def __init__(self, db_path='crime_data.db', contamination=0.01, random_state=42, crimes=None):
+        self.db_path = db_path
+        self.contamination = contamination
+        self.random_state = random_state
+        self.crimes = crimes
+        self._lock = threading.RLock()
+        self.refresh()
+
+    # Drop the cached results so the next access re-reads the database
+    def refresh(self):
+        with self._lock:
+            self._crime_counts = None
+            self._anomalous_incidents = None
+            self._series_counts = {}
+
+    # Daily crime counts with the Isolation Forest label of each day (-1 for anomalies)
+    @property
+    def crime_counts(self):
+        with self._lock:
+            if self._crime_counts is None:
+                with stage('anomalies.daily_counts') as current:
+                    crime_counts = self.daily_counts()
+                    current.rows_in = len(crime_counts)
+                    model = IsolationForest(contamination=self.contamination, random_state=self.random_state)
+                    crime_counts['anomaly'] = model.fit_predict(crime_counts[['count']])
+                    current.rows_out = int((crime_counts['anomaly'] == -1).sum())
+                self._crime_counts = crime_counts
+            return self._crime_counts
+
+    # Anomalous days with more crimes than the average day
+    @property
+    def high_anomalies(self):
+        crime_counts = self.crime_counts
+        return crime_counts[(crime_counts['anomaly'] == -1) & (crime_counts['count'] > crime_counts['count'].mean())]
+
+    # Incidents on the high-anomaly days, with their day's count and label.
+    # As in the original per-incident merge, "high" here means above the incident-weighted mean
+    # daily count, sum(count^2) / sum(count), which is computed from the daily counts directly.
+    @property
+    def anomalous_incidents(self):
+        with self._lock:
+            if self._anomalous_incidents is None:
+                crime_counts = self.crime_counts
+                with stage('anomalies.incidents') as current:
+                    weighted_mean = (crime_counts['count'] ** 2).sum() / crime_counts['count'].sum()
+                    days = crime_counts[(crime_counts['anomaly'] == -1) & (crime_counts['count'] > weighted_mean)]
+                    columns = ['datetime', 'primary_type', 'location_description', 'latitude', 'longitude']
+                    if self.crimes is None:
+                        incidents = load_crimes(self.db_path, columns, days=list(days['date']))
+                    else:
+                        current.rows_in = len(self.crimes)
+                        incidents = self.crimes.loc[self.crimes['datetime'].dt.normalize().isin(days['date']), columns].reset_index(drop=True)
+                    incidents['date'] = incidents['datetime'].dt.normalize()
+                    self._anomalous_incidents = incidents.merge(days, on='date')
+                    current.rows_out = len(self._anomalous_incidents)
+            return self._anomalous_incidents
+
+    def daily_counts(self, by=None):
+        if self.crimes is not None:
+            return count_by_day(self.crimes, by)
+        return load_daily_counts(self.db_path, by=by)
+
+    # Daily counts per group (e.g. district and primary_type), cached per grouping
+    def series_counts(self, by):
+        by = tuple(by)
+        with self._lock:
+            if by not in self._series_counts:
+                self._series_counts[by] = self.daily_counts(list(by))
+            return self._series_counts[by]
+
+    # Ranked anomalies for every series of a grouping; see score_series for the options
+    def series_anomalies(self, by=('district', 'primary_type'), **options):
+        options.setdefault('random_state', self.random_state)
+        return score_series(self.series_counts(by), list(by), **options)
+
+    # Functions to plot each subplot
+    def plot_high_anomalies(self, ax):
+        crime_counts = self.crime_counts
+        high_anomalies = self.high_anomalies
+        ax.plot(crime_counts['date'], crime_counts['count'], label='Daily Crime Counts', color='blue')
+        ax.scatter(high_anomalies['date'], high_anomalies['count'], color='red', label='High Anomalies')
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Number of Crimes')
+        ax.set_title('High Anomalies in Daily Crime Counts')
+        ax.legend()
+
+    def plot_monthly_anomalies(self, ax):
+        high_anomalies_df = self.anomalous_incidents
+        monthly_anomalies = high_anomalies_df['date'].dt.month.value_counts().sort_index().reset_index()
+        monthly_anomalies.columns = ['month', 'count']
+        ax.bar(monthly_anomalies['month'], monthly_anomalies['count'], color='skyblue')
+        ax.set_xlabel('Month')
+        ax.set_ylabel('Number of Anomalies')
+        ax.set_title('Monthly Anomalies')
+        ax.set_xticks(range(1, 13))
+        ax.set_xticklabels(['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'])
+
+    def plot_weekly_anomalies(self, ax):
+        high_anomalies_df = self.anomalous_incidents
+        weekly_anomalies = high_anomalies_df['date'].dt.dayofweek.value_counts().sort_index().reset_index()
+        weekly_anomalies.columns = ['day_of_week', 'count']
+        ax.bar(weekly_anomalies['day_of_week'], weekly_anomalies['count'], color='salmon')
+        ax.set_xlabel('Day of the Week')
+        ax.set_ylabel('Number of Anomalies')
+        ax.set_title('Weekly Anomalies')
+        ax.set_xticks(range(7))
+        ax.set_xticklabels(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+
+    def plot_crime_type_anomalies(self, ax):
+        high_anomalies_df = self.anomalous_incidents
+        crime_type_anomalies = high_anomalies_df['primary_type'].value_counts().loc[lambda counts: counts > 0].reset_index()
+        crime_type_anomalies.columns = ['Crime Type', 'Count']
+        ax.bar(crime_type_anomalies['Crime Type'], crime_type_anomalies['Count'], color='purple', alpha=0.7)
+        ax.set_xlabel('Crime Type')
+        ax.set_ylabel('Number of Anomalies')
+        ax.set_title('Anomalies by Crime Type')
+        ax.set_xticks(range(len(crime_type_anomalies)))
+        ax.set_xticklabels(crime_type_anomalies['Crime Type'], rotation=90)
+
+    # Map of the incidents on high-anomaly days
+    @profiled('anomalies.map', rows_in=lambda self, *args, **kwargs: len(self.anomalous_incidents))
+    def save_anomaly_map(self, map_path='crime_anomalies_map.html'):
+        high_anomalies_locations = self.anomalous_incidents.dropna(subset=['latitude', 'longitude'])
+
+        # Create a base map
+        map_center = [high_anomalies_locations['latitude'].mean(), high_anomalies_locations['longitude'].mean()]
+        crime_map = folium.Map(location=map_center, zoom_start=11)
+
+        # Add beat boundaries to the map
+        add_beat_layer(crime_map)
+
+        # Add a marker cluster to the map
+        marker_cluster = MarkerCluster().add_to(crime_map)
+
+        # Add markers to the map with popups showing relevant details
+        for row in high_anomalies_locations.itertuples(index=False):
+            popup_text = f"""
+            <b>Crime Type:</b> {row.primary_type}<br>
+            <b>Date:</b> {row.date.date()}<br>
+            <b>Location:</b> {row.location_description}<br>
+            <b>Time:</b> {row.datetime.strftime('%H:%M:%S')}
+            """
+            folium.Marker(
+                location=[row.latitude, row.longitude],
+                popup=popup_text
+            ).add_to(marker_cluster)
+
+        # Save the map to an HTML file
+        crime_map.save(map_path)
+        return map_path
+
+    # 2x2 summary of the high-anomaly days. figure=Figure builds it without pyplot, so it can be
+    # made off the GUI thread; plt.figure makes one plt.show() can display.
+    def analysis_figure(self, figure=Figure):
+        fig = figure(figsize=(21, 14))  # Adjusted size
+        axs = fig.subplots(2, 2)
+
+        self.plot_high_anomalies(axs[0, 0])
+        self.plot_monthly_anomalies(axs[0, 1])
+        self.plot_weekly_anomalies(axs[1, 0])
+        self.plot_crime_type_anomalies(axs[1, 1])
+
+        fig.tight_layout()
+        return fig
 
     # Additional Data Distribution Analysis
-    plt.figure(figsize=(14, 7))
+    def distribution_figure(self, figure=Figure):
+        fig = figure(figsize=(14, 7))
+        ax = fig.subplots()
+
+        # Plot daily crime counts distribution
+        ax.hist(self.crime_counts['count'], bins=50, color='blue', alpha=0.7)
+        ax.set_xlabel('Number of Crimes')
+        ax.set_ylabel('Frequency')
+        ax.set_title('Distribution of Daily Crime Counts')
+
+        fig.tight_layout()
+        return fig
+
+    # Function to detect anomalies and plot them. The plots and the map are always saved, to
+    # output_dir; show=False skips opening them, for callers that display the results themselves.
+    @profiled('anomalies.detect')
+    def detect_anomalies(self, show=True, output_dir='.'):
+        figure = plt.figure if show else Figure
+
+        # Visualize high anomalies
+        self.analysis_figure(figure).savefig(os.path.join(output_dir, 'anomalies_analysis.png'))
+
+        map_path = self.save_anomaly_map(os.path.join(output_dir, 'crime_anomalies_map.html'))
+
+        # Automatically open the HTML file in the default web browser
+        if show:
+            webbrowser.open('file://' + os.path.realpath(map_path))
+
+        print(f"Crime anomalies map saved to {map_path}")
 
-    # Plot daily crime counts distribution
-    plt.hist(crime_counts['count'], bins=50, color='blue', alpha=0.7)
-    plt.xlabel('Number of Crimes')
-    plt.ylabel('Frequency')
-    plt.title('Distribution of Daily Crime Counts')
+        self.distribution_figure(figure).savefig(os.path.join(output_dir, 'data_distribution_analysis.png'))
+        if show:
+            plt.show()
+        return map_path
 
-    plt.tight_layout()
-    plt.savefig('data_distribution_analysis.png')
-    plt.show()
+def detect_anomalies(db_path='crime_data.db'):
+    AnomalyDetector(db_path).detect_anomalies()
 
 # Run the anomaly detection when this script is executed
 if __name__ == "__main__":
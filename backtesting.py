@@ -0,0 +1,144 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from crime_db import connect, connect_reader, load_daily_counts
+from anomalies import count_matrix
+from forecasting import BACKENDS, series_names
+
+# Rolling-origin backtests of the forecasting backends. Each fold trains a backend on the days
+# before a cutoff and forecasts the next horizon days; the errors of every series go to the
+# forecast_metrics table. Folds already in the table are skipped, so a nightly run only
+# evaluates the new cutoffs.
+
+# Backends run when none are given; Prophet is opt-in, e.g. {'prophet': {'n_jobs': 1}}
+DEFAULT_BACKENDS = {'seasonal_naive': {}, 'fourier_ridge': {}}
+
+# Daily count matrix shared by every fold a worker runs, set once per process
+_fold_data = {}
+
+def load_fold_data(keys, dates, matrix):
+    _fold_data.update(keys=keys, dates=dates, matrix=matrix)
+
+# MAE, RMSE and MAPE of each series (rows) over the forecast days. MAPE only counts days with
+# at least one incident and is NaN for a series without any.
+def fold_errors(actual, predicted):
+    error = np.abs(predicted - actual)
+    nonzero = actual > 0
+    days = nonzero.sum(axis=1)
+    percentage = np.where(nonzero, error / np.where(nonzero, actual, 1), 0).sum(axis=1)
+    mape = np.full(len(actual), np.nan)
+    mape[days > 0] = 100 * percentage[days > 0] / days[days > 0]
+    return error.mean(axis=1), np.sqrt((error ** 2).mean(axis=1)), mape
+
+# Runs in a worker process: one backend at one cutoff over all series
+def run_fold(backend_name, backend_options, cutoff, horizon, train_days):
+    keys, dates, matrix = _fold_data['keys'], _fold_data['dates'], _fold_data['matrix']
+    end = dates.get_loc(cutoff)
+    begin = max(0, end - train_days) if train_days else 0
+    backend = BACKENDS[backend_name](**backend_options)
+    start = time.perf_counter()
+    predicted = backend.fit(keys, dates[begin:end], matrix[:, begin:end]).predict(dates[end:end + horizon])
+    seconds = time.perf_counter() - start
+    mae, rmse, mape = fold_errors(matrix[:, end:end + horizon], predicted)
+    return pd.DataFrame({
+        'series': series_names(keys),
+        'backend': backend_name,
+        'cutoff': str(cutoff.date()),
+        'horizon': horizon,
+        'train_days': train_days or 0,
+        'mae': mae,
+        'rmse': rmse,
+        'mape': mape,
+        'fit_seconds': seconds,
+    })
+
+def save_metrics(conn, grouping, metrics, run_at):
+    rows = metrics.assign(grouping=grouping, run_at=run_at)[['grouping', 'series', 'backend', 'cutoff', 'horizon', 'train_days', 'mae', 'rmse', 'mape', 'fit_seconds', 'run_at']]
+    rows = rows.astype(object).where(rows.notna(), None)
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO forecast_metrics (grouping, series, backend, cutoff, horizon, train_days, mae, rmse, mape, fit_seconds, run_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            list(rows.itertuples(index=False, name=None))
+        )
+
+# Backtest every backend at every cutoff for the series of a grouping (e.g. ['area'] or ['beat']).
+# The daily counts are read and densified once and handed to each worker process once; folds
+# run in parallel and are saved as they finish, so an interrupted run keeps its finished folds.
+# Cutoffs default to the first of each of the last n_cutoffs months with a full horizon after
+# them. train_days limits training to a sliding window; by default it expands from start.
+# Returns the metrics of the folds run now; rerun=True recomputes folds already stored.
+def run_backtest(db_path, by=('area',), backends=None, cutoffs=None, n_cutoffs=12, horizon=28, train_days=None, start=None, n_jobs=None, rerun=False):
+    by = list(by)
+    grouping = ','.join(by)
+    backends = backends or DEFAULT_BACKENDS
+    keys, dates, matrix = count_matrix(load_daily_counts(db_path, start=start, by=by), by)
+    last_cutoff = dates[-1] - pd.Timedelta(days=horizon - 1)
+    if cutoffs is None:
+        cutoffs = pd.date_range(end=last_cutoff, periods=n_cutoffs, freq='MS')
+    cutoffs = [cutoff for cutoff in pd.to_datetime(cutoffs) if dates[0] + pd.Timedelta(days=14) <= cutoff <= last_cutoff]
+
+    conn = connect(db_path)
+    done = set()
+    if not rerun:
+        done = set(conn.execute(
+            "SELECT DISTINCT backend, cutoff FROM forecast_metrics WHERE grouping = ? AND horizon = ? AND train_days = ?",
+            (grouping, horizon, train_days or 0)
+        ).fetchall())
+    folds = [
+        (name, options, cutoff, horizon, train_days)
+        for name, options in backends.items()
+        for cutoff in cutoffs
+        if (name, str(cutoff.date())) not in done
+    ]
+
+    run_at = datetime.now().isoformat(timespec='seconds')
+    results = []
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(folds)) or 1
+    if n_jobs == 1:
+        load_fold_data(keys, dates, matrix)
+        for fold in folds:
+            results.append(run_fold(*fold))
+            save_metrics(conn, grouping, results[-1], run_at)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=load_fold_data, initargs=(keys, dates, matrix)) as executor:
+            futures = [executor.submit(run_fold, *fold) for fold in folds]
+            for future in as_completed(futures):
+                results.append(future.result())
+                save_metrics(conn, grouping, results[-1], run_at)
+    conn.close()
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+# Average errors per backend and horizon over every stored fold of a grouping
+def backtest_summary(db_path, by=('area',)):
+    conn = connect_reader(db_path)
+    summary = pd.read_sql_query(
+        """
+        SELECT backend, horizon, train_days, COUNT(DISTINCT cutoff) AS folds,
+               AVG(mae) AS mae, AVG(rmse) AS rmse, AVG(mape) AS mape, AVG(fit_seconds) AS fold_seconds
+        FROM forecast_metrics WHERE grouping = ?
+        GROUP BY backend, horizon, train_days ORDER BY horizon, mae
+        """,
+        conn, params=(','.join(by),)
+    )
+    conn.close()
+    return summary
+
+# Nightly sweep, e.g. python backtesting.py crime_data.db --by beat --prophet
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('db_path', nargs='?', default='crime_data.db')
+    parser.add_argument('--by', default='area', help='grouping column(s), comma separated')
+    parser.add_argument('--cutoffs', type=int, default=12)
+    parser.add_argument('--horizon', type=int, default=28)
+    parser.add_argument('--train-days', type=int, default=None)
+    parser.add_argument('--prophet', action='store_true', help='also backtest Prophet')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    backends = dict(DEFAULT_BACKENDS, **({'prophet': {'n_jobs': 1}} if args.prophet else {}))
+    by = args.by.split(',')
+    run_backtest(args.db_path, by, backends, n_cutoffs=args.cutoffs, horizon=args.horizon, train_days=args.train_days, n_jobs=args.workers)
+    print(backtest_summary(args.db_path, by).to_string(index=False))
@@ -0,0 +1,167 @@
+# Headless runner: ingest and any of the analyses in one process, without a display.
+# The incidents are loaded and typed once and shared by every stage that needs them, and each
+# stage writes its maps, plots and tables to the output directory.
+# Every stage is profiled (see profiling.py); the run ends with a breakdown of where the time went.
+# Usage: python batch_runner.py --db crime_data.db --stages ingest,clustering,anomalies,time_series,arrest --output-dir out
+
+import matplotlib
+matplotlib.use('Agg')
+
+import argparse
+import os
+import sys
+import traceback
+from datetime import date, timedelta
+from crime_db import count_by_day, load_crimes, load_daily_counts
+from data_cleaning import DataCleaningPipeline
+from anomalies import AnomalyDetector, OnlineAnomalyScorer
+from clustering_analysis import run_analysis
+from decision_tree_analysis import run_decision_tree_analysis
+from model_registry import ModelRegistry
+import profiling
+import time_series_analysis
+
+STAGES = ['ingest', 'clustering', 'anomalies', 'time_series', 'arrest']
+
+# Columns loaded for the shared incidents: what clustering, anomaly incidents and the arrest
+# model features read between them
+DATASET_COLUMNS = [
+    'id', 'timestamp', 'datetime', 'primary_type', 'primary_type_id', 'description', 'location_description',
+    'location_description_id', 'beat', 'district', 'arrest', 'latitude', 'longitude', 'area', 'utm_x', 'utm_y',
+]
+
+# The incidents of the run's window, read from the database the first time a stage needs them.
+# Daily counts come from them once loaded, and from the daily_counts table otherwise.
+class Dataset:
+    def __init__(self, db_path, start=None, end=None):
+        self.db_path = db_path
+        self.start = start
+        self.end = end
+        self._crimes = None
+
+    @property
+    def crimes(self):
+        if self._crimes is None:
+            with profiling.stage('batch.dataset') as current:
+                self._crimes = load_crimes(self.db_path, DATASET_COLUMNS, start=self.start, end=self.end)
+                current.rows_out = len(self._crimes)
+            print(f"Loaded {len(self._crimes):,} incidents ({self._crimes.memory_usage(deep=True).sum() / 2 ** 20:.0f} MB)")
+        return self._crimes
+
+    def daily_counts(self, by=None):
+        if self._crimes is not None:
+            return count_by_day(self._crimes, by)
+        return load_daily_counts(self.db_path, start=self.start, end=self.end, by=by)
+
+def run_ingest(dataset, args):
+    end = args.ingest_end or str(date.today() + timedelta(days=1))
+    start = args.ingest_start or str(date.fromisoformat(end) - timedelta(days=args.ingest_days))
+    pipeline = DataCleaningPipeline(dataset.db_path)
+    if args.replace:
+        counts = pipeline.fetch_initial_data(args.dataset, start, end)
+        OnlineAnomalyScorer(dataset.db_path).reset()
+    else:
+        counts = pipeline.add_new_data(args.dataset, start, end)
+    print(f"Ingested {start} to {end}: {counts['inserted']} rows inserted, {counts['updated']} rows updated")
+    new_anomalies = OnlineAnomalyScorer(dataset.db_path).update()
+    new_anomalies.to_csv(os.path.join(args.output_dir, 'new_anomalies.csv'), index=False)
+    print(f"{len(new_anomalies)} new district/crime type anomalies")
+
+def run_clustering(dataset, args):
+    summary = run_analysis(dataset.db_path, dataset.crimes, os.path.join(args.output_dir, 'crime_clusters.html'), open_browser=False)
+    summary.to_csv(os.path.join(args.output_dir, 'crime_clusters.csv'), index=False)
+    print(f"{len(summary)} clusters")
+
+def run_anomalies(dataset, args):
+    detector = AnomalyDetector(dataset.db_path, crimes=dataset.crimes)
+    detector.detect_anomalies(show=False, output_dir=args.output_dir)
+    detector.high_anomalies.to_csv(os.path.join(args.output_dir, 'high_anomalies.csv'), index=False)
+    series = detector.series_anomalies(top=args.top_anomalies)
+    series.to_csv(os.path.join(args.output_dir, 'series_anomalies.csv'), index=False)
+    print(f"{len(detector.high_anomalies)} high-anomaly days, {len(series)} district/crime type anomalies")
+
+def run_time_series(dataset, args):
+    figures = time_series_analysis.run_time_series_analysis(dataset.db_path, n_jobs=args.workers, daily_counts=dataset.daily_counts(['area']))
+    for i, fig in enumerate(figures, start=1):
+        fig.savefig(os.path.join(args.output_dir, f'time_series_{i}.png'))
+
+def run_arrest(dataset, args):
+    selected_vars = args.arrest_vars.split(',')
+    buf_feature_importance, buf_roc, stats = run_decision_tree_analysis(
+        dataset.db_path, selected_vars, start=args.arrest_start, end=args.arrest_end, mode=args.arrest_mode,
+        registry=ModelRegistry(args.model_dir), crimes=dataset.crimes
+    )
+    for name, buf in [('feature_importances.png', buf_feature_importance), ('arrest_roc.png', buf_roc)]:
+        with open(os.path.join(args.output_dir, name), 'wb') as f:
+            f.write(buf.getvalue())
+    with open(os.path.join(args.output_dir, 'arrest_model.txt'), 'w') as f:
+        f.write(stats)
+    print(stats.splitlines()[0])
+
+STAGE_FUNCTIONS = {
+    'ingest': run_ingest,
+    'clustering': run_clustering,
+    'anomalies': run_anomalies,
+    'time_series': run_time_series,
+    'arrest': run_arrest,
+}
+
+# Run the stages in STAGES order. A failed stage is reported and the rest still run; the exit
+# status is 1 if any failed.
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run CrimeSight stages without the GUI.')
+    parser.add_argument('--db', default='crime_data.db')
+    parser.add_argument('--stages', default='clustering,anomalies,time_series,arrest', help=f"comma separated, from {','.join(STAGES)}")
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--start', default=None, help='first day of incidents the analyses load')
+    parser.add_argument('--end', default=None, help='day after the last day of incidents the analyses load')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dataset', default='ijzp-q8t2', help='Socrata dataset to ingest')
+    parser.add_argument('--ingest-start', default=None)
+    parser.add_argument('--ingest-end', default=None, help='defaults to tomorrow')
+    parser.add_argument('--ingest-days', type=int, default=7, help='days before --ingest-end to ingest when --ingest-start is not given')
+    parser.add_argument('--replace', action='store_true', help='rebuild the crimes table from the ingest window')
+    parser.add_argument('--top-anomalies', type=int, default=100)
+    parser.add_argument('--arrest-vars', default='primary_type,description,location_description,beat,district,latitude,longitude')
+    parser.add_argument('--arrest-start', default='2023-01-01')
+    parser.add_argument('--arrest-end', default='2024-01-01')
+    parser.add_argument('--arrest-mode', default='smote')
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--profile-log', default=profiling.settings['log_path'], help='JSON-lines file the stage records are appended to')
+    parser.add_argument('--hot-paths', choices=['cprofile', 'py-spy'], default=profiling.settings['profile'], help='dump the hot paths of each stage')
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    profiling.configure(log_path=args.profile_log, profile=args.hot_paths)
+    records = []
+    profiling.add_listener(records.append)
+
+    dataset = Dataset(args.db, args.start, args.end)
+    failed = []
+    for stage in [stage for stage in STAGES if stage in stages]:
+        print(f"[{stage}] running...")
+        measured = profiling.stage(f'batch.{stage}')
+        try:
+            with measured:
+                STAGE_FUNCTIONS[stage](dataset, args)
+        except Exception:
+            traceback.print_exc()
+            failed.append(stage)
+            print(f"[{stage}] failed after {measured.record['seconds']:.1f}s")
+        else:
+            print(f"[{stage}] done in {measured.record['seconds']:.1f}s")
+    profiling.remove_listener(records.append)
+
+    print("Stage profile:")
+    for record in sorted(records, key=lambda record: (record['started_at'], record['depth'])):
+        print(profiling.format_record(record))
+    if failed:
+        print(f"Failed stages: {', '.join(failed)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import folium
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# Police beat boundaries from the Chicago Data Portal
+BEAT_SHAPEFILE = 'boundaries/geo_export_0b908a58-99fc-452e-866d-07ad3860c3ca.shp'
+CACHE_DIR = '.cache'
+
+# Simplification tolerance in degrees (about 10 m), well below what is visible on a city map
+SIMPLIFY_TOLERANCE = 0.0001
+
+# Beat GeoJSON already loaded by this process, keyed by source hash and tolerance
+_geojson_cache = {}
+
+# Full-resolution beat polygons with their beat and district codes, keyed by shapefile path
+_beat_index_cache = {}
+
+# Source hashes already computed by this process, keyed by path and the files' mtime and size
+_hash_cache = {}
+
+# Hash of the shapefile and its attribute table, so edits to the source invalidate the cache.
+# The files are only read again when their modification time or size changes.
+def shapefile_hash(shapefile_path):
+    paths = [shapefile_path, os.path.splitext(shapefile_path)[0] + '.dbf']
+    stamp = tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None for path in paths)
+    key = (os.path.abspath(shapefile_path), stamp)
+    if key not in _hash_cache:
+        digest = hashlib.sha256()
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+        _hash_cache[key] = digest.hexdigest()
+    return _hash_cache[key]
+
+# Simplified beat boundaries as GeoJSON text. The shapefile is only read the first time: the
+# topology-preserving simplification is stored under cache_dir keyed by the source file's hash.
+def beat_boundaries_geojson(shapefile_path=BEAT_SHAPEFILE, tolerance=SIMPLIFY_TOLERANCE, cache_dir=CACHE_DIR):
+    key = f'{shapefile_hash(shapefile_path)[:16]}_{tolerance}'
+    if key in _geojson_cache:
+        return _geojson_cache[key]
+
+    cache_path = os.path.join(cache_dir, f'beat_boundaries_{key}.geojson')
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            geojson = f.read()
+    else:
+        beats = gpd.read_file(shapefile_path).to_crs('EPSG:4326')
+        geometry = beats.geometry.simplify(tolerance, preserve_topology=True)
+        beats = beats.set_geometry(shapely.set_precision(geometry.values, 1e-6))
+        geojson = beats.to_json(drop_id=True)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            f.write(geojson)
+
+    _geojson_cache[key] = geojson
+    return geojson
+
+# Add all beat boundaries to a map as a single GeoJSON layer
+def add_beat_layer(map, geojson=None):
+    folium.GeoJson(
+        geojson if geojson is not None else beat_boundaries_geojson(),
+        name='Beat boundaries',
+        style_function=lambda feature: {'color': '#3388ff', 'weight': 1, 'fillOpacity': 0.05},
+    ).add_to(map)
+
+# Full-resolution beat polygons with integer beat and district codes, prepared for repeated
+# predicate tests. Loaded once per process; the join needs exact edges, so the simplified cache
+# is not used here.
+def load_beat_index(shapefile_path=BEAT_SHAPEFILE):
+    if shapefile_path not in _beat_index_cache:
+        beats = gpd.read_file(shapefile_path).to_crs('EPSG:4326')
+        polygons = np.asarray(beats.geometry.values)
+        shapely.prepare(polygons)
+        _beat_index_cache[shapefile_path] = (
+            polygons,
+            pd.to_numeric(beats['beat_num'], errors='coerce').fillna(-1).astype('int64').to_numpy(),
+            pd.to_numeric(beats['district'], errors='coerce').fillna(-1).astype('int64').to_numpy(),
+        )
+    return _beat_index_cache[shapefile_path]
+
+# Beat and district of the polygon containing each point, or -1 where no polygon does.
+# Each chunk of points goes into an STRtree that is queried with all ~275 beat polygons at once,
+# so every prepared polygon is tested only against the points in its bounding box. A point on
+# an edge shared by two beats is given one of them.
+def assign_beats(longitude, latitude, shapefile_path=BEAT_SHAPEFILE, chunksize=500000):
+    polygons, beat_codes, district_codes = load_beat_index(shapefile_path)
+    longitude = np.asarray(longitude, dtype='float64')
+    latitude = np.asarray(latitude, dtype='float64')
+    beat = np.full(len(longitude), -1, dtype='int64')
+    district = np.full(len(longitude), -1, dtype='int64')
+    for start in range(0, len(longitude), chunksize):
+        lon, lat = longitude[start:start + chunksize], latitude[start:start + chunksize]
+        valid = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat)))
+        tree = shapely.STRtree(shapely.points(lon[valid], lat[valid]))
+        polygon_index, point_index = tree.query(polygons, predicate='covers')
+        rows = start + valid[point_index]
+        beat[rows] = beat_codes[polygon_index]
+        district[rows] = district_codes[polygon_index]
+    return beat, district
@@ -0,0 +1,91 @@
+# Compare arrest model training configurations on fit time, memory and test AUC.
+# Uses the decision tree features of a crime database when --db is given, otherwise a synthetic
+# feature matrix of --rows incidents with an imbalanced arrest flag. Memory is the process RSS
+# sampled during the fit (see profiling.py), so it covers the native buffers of the trees, SMOTE
+# and numpy; rss_growth_mb is how far the fit raised it. A fit can reuse memory an earlier fit
+# freed without raising RSS, so for exact figures measure one configuration per run with --only.
+# Usage: python benchmarks/bench_arrest_model.py [--db crime_data.db --start 2019-01-01] [--rows 500000]
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+from decision_tree_analysis import build_features, load_feature_data, train_model
+import profiling
+
+SELECTED_VARS = ['primary_type', 'description', 'location_description', 'beat', 'district', 'latitude', 'longitude']
+
+# (label, mode, options) for each configuration; smote with n_jobs=1 is the original setup
+CONFIGURATIONS = [
+    ('smote, 1 core', 'smote', {'n_jobs': 1}),
+    ('smote, all cores', 'smote', {}),
+    ('balanced', 'balanced', {}),
+    ('balanced, 25% samples, depth 20', 'balanced', {'max_samples': 0.25, 'max_depth': 20}),
+    ('hist_gb', 'hist_gb', {}),
+]
+
+# Feature matrix shaped like build_features output: coded categoricals, beat/district,
+# coordinates and hour/weekday/month, with about 25% arrests driven by type and location
+def synthetic_features(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    primary_type = rng.integers(1, 30, rows)
+    location = rng.integers(1, 120, rows)
+    district = rng.integers(1, 26, rows)
+    X = np.column_stack([
+        primary_type, rng.integers(0, 300, rows), location, district * 100 + rng.integers(11, 35, rows), district,
+        41.65 + rng.random(rows) * 0.35, -87.85 + rng.random(rows) * 0.3,
+        rng.integers(0, 24, rows), rng.integers(0, 7, rows), rng.integers(1, 13, rows),
+    ]).astype('float32')
+    logit = -1.8 + 2.0 * (primary_type % 7 == 0) + 0.8 * (location % 5 == 0) - 0.3 * (district % 3 == 0)
+    y = (rng.random(rows) < 1 / (1 + np.exp(-logit))).astype('int8')
+    return X, y
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=None, help='crime database; synthetic features when omitted')
+    parser.add_argument('--start', default='2023-01-01')
+    parser.add_argument('--end', default='2024-01-01')
+    parser.add_argument('--rows', type=int, default=300000, help='synthetic row count')
+    parser.add_argument('--skip', default='', help='semicolon separated configuration labels to skip')
+    parser.add_argument('--only', default=None, help='run just this configuration label')
+    args = parser.parse_args()
+    profiling.configure(log_path=None)
+
+    if args.db:
+        data = load_feature_data(args.db, SELECTED_VARS, args.start, args.end)
+        X, _, _ = build_features(data, SELECTED_VARS)
+        y = data['arrest'].to_numpy(dtype='int8')
+    else:
+        X, y = synthetic_features(args.rows)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
+    print(f"{len(X_train)} training rows, {X.shape[1]} features, {y.mean():.1%} arrests, {os.cpu_count()} cores")
+
+    results = []
+    for label, mode, options in CONFIGURATIONS:
+        if label in args.skip.split(';') or (args.only is not None and label != args.only):
+            continue
+        with profiling.stage(f'bench.{label}', rows_in=len(X_train)) as measured:
+            model = train_model(X_train, y_train, mode, **options)
+        auc = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+        results.append({
+            'configuration': label,
+            'fit_seconds': measured.record['seconds'],
+            'cpu_seconds': measured.record['cpu_seconds'],
+            'peak_rss_mb': measured.record['peak_rss_mb'],
+            'rss_growth_mb': measured.record['rss_growth_mb'],
+            'auc': auc,
+        })
+        model = None
+        print(results[-1])
+
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+
+if __name__ == "__main__":
+    main()
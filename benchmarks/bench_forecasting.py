@@ -0,0 +1,69 @@
+# Compare forecasting backends on accuracy (MAE/RMSE over a holdout) and runtime.
+# Uses daily counts from a crime database when --db is given, otherwise synthetic series with
+# weekly and yearly seasonality. Prophet is slow, so it is scored on the first --prophet-series
+# series only, and the fast backends are also reported on that subset for a like-for-like row.
+# Usage: python benchmarks/bench_forecasting.py [--db crime_data.db --by beat] [--holdout-days 90]
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomalies import count_matrix
+from crime_db import load_daily_counts
+from forecasting import FourierRidgeBackend, ProphetBackend, SeasonalNaiveBackend, evaluate
+
+# Poisson counts around a per-series level with weekday and yearly cycles and a slow trend
+def synthetic_counts(series, years, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2014-01-01', periods=int(365.25 * years), freq='D')
+    level = rng.gamma(2.0, 2.0, size=(series, 1))
+    weekly = np.array([1.0, 0.95, 0.95, 1.0, 1.1, 1.2, 1.1])[dates.dayofweek]
+    yearly = 1 + 0.25 * np.sin(2 * np.pi * (dates.dayofyear.to_numpy() - 100) / 365.25)
+    trend = np.linspace(1.0, 0.8, len(dates))
+    matrix = rng.poisson(level * weekly * yearly * trend).astype('float32')
+    keys = pd.DataFrame({'series': np.arange(series)})
+    return keys, dates, matrix
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=None, help='crime database; synthetic series when omitted')
+    parser.add_argument('--by', default='beat', help='grouping column(s), comma separated')
+    parser.add_argument('--start', default='2014-01-01')
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--series', type=int, default=300, help='synthetic series count')
+    parser.add_argument('--years', type=float, default=10, help='synthetic history length')
+    parser.add_argument('--holdout-days', type=int, default=90)
+    parser.add_argument('--prophet-series', type=int, default=3, help='0 to skip Prophet')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+
+    if args.db:
+        by = args.by.split(',')
+        keys, dates, matrix = count_matrix(load_daily_counts(args.db, start=args.start, end=args.end, by=by), by)
+    else:
+        keys, dates, matrix = synthetic_counts(args.series, args.years)
+    print(f"{len(keys)} series x {len(dates)} days, holdout {args.holdout_days} days")
+
+    results = [evaluate(backend, keys, dates, matrix, args.holdout_days) for backend in [SeasonalNaiveBackend(), FourierRidgeBackend()]]
+    if args.prophet_series:
+        subset = slice(0, args.prophet_series)
+        subset_keys, subset_matrix = keys.iloc[subset], matrix[subset]
+        # A fresh model cache, so Prophet is timed on cold fits
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for backend in [SeasonalNaiveBackend(), FourierRidgeBackend(), ProphetBackend(n_jobs=args.workers, cache_dir=cache_dir)]:
+                result = evaluate(backend, subset_keys, dates, subset_matrix, args.holdout_days)
+                result['backend'] += ' (subset)'
+                results.append(result)
+
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Compare the serial page loop with parallel_ingest against a local Socrata stand-in.
+# Usage: python benchmarks/bench_parallel_fetch.py [--rows 200000] [--latency 0.3] [--workers 8]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cleaning import DataCleaningPipeline
+from socrata_stub import SocrataStub, generate_records
+
+def timed_ingest(stub, ingest):
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = DataCleaningPipeline(os.path.join(tmp, 'bench.db'), domain=stub.domain, uri_prefix='http://')
+        start = time.perf_counter()
+        counts = ingest(pipeline)
+        return time.perf_counter() - start, counts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--latency', type=float, default=0.3, help='simulated round trip per request, seconds')
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second')
+    args = parser.parse_args()
+
+    records = generate_records(args.rows)
+    start_date, end_date = '2023-01-01', '2023-12-31T23:59:59.999'
+    with SocrataStub(records, latency=args.latency) as stub:
+        serial_time, serial_counts = timed_ingest(stub, lambda p: p.stream_ingest('bench', start_date, end_date, page_size=args.page_size))
+        parallel_time, parallel_counts = timed_ingest(stub, lambda p: p.parallel_ingest(
+            'bench', start_date, end_date, max_workers=args.workers, requests_per_second=args.rate_limit, page_size=args.page_size))
+
+    print(f"serial:   {serial_time:7.2f}s  {serial_counts}")
+    print(f"parallel: {parallel_time:7.2f}s  {parallel_counts}  ({args.workers} workers)")
+    print(f"speedup:  {serial_time / parallel_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# End-to-end benchmark of every pipeline stage on synthetic databases of growing size.
+# For each size a database is generated (benchmarks/synthetic_crimes.py) through the ingest
+# upsert, then each stage is measured as a profiling stage (see profiling.py): wall and CPU
+# seconds, peak RSS (this process plus its worker processes, sampled every 50 ms) and rows per
+# second. Results are written as JSON; pass an earlier file as --baseline to print the change
+# against it, and --profile-log to also keep the records of the steps inside each stage.
+# Usage: python benchmarks/bench_suite.py --sizes 1M,10M,50M --output bench_results.json [--baseline old.json]
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+
+from anomalies import AnomalyDetector
+from beat_boundaries import BEAT_SHAPEFILE, beat_boundaries_geojson
+from clustering_analysis import CLUSTER_COLUMNS, apply_dbscan, create_map_with_cluster_size
+from crime_db import load_crimes, load_daily_counts, project_to_utm
+from decision_tree_analysis import run_decision_tree_analysis
+import profiling
+from synthetic_crimes import parse_rows, write_database
+from time_series_analysis import run_time_series_analysis
+
+STAGES = ['ingest', 'load', 'utm', 'dbscan', 'map', 'anomalies', 'prophet', 'random_forest']
+
+ARREST_VARS = ['primary_type', 'description', 'location_description', 'beat', 'district', 'latitude', 'longitude']
+
+MEASURES = ['seconds', 'cpu_seconds', 'peak_rss_mb', 'rss_growth_mb', 'rows_per_second']
+
+# Measure the block as a profiling stage and copy the measures into result.
+# The block sets result['rows'] to the rows it handled.
+# Without psutil the peak is the process high-water mark so far, which never goes down.
+@contextmanager
+def measure(result):
+    measured = profiling.stage(f"bench.{result['stage']}", rows_total=result['rows_total'])
+    try:
+        with measured:
+            yield result
+            measured.rows_in = result.get('rows')
+    finally:
+        result.update({key: measured.record[key] for key in MEASURES})
+
+# Run the stages on one database of rows incidents, in a fresh temporary directory
+def run_size(rows, stages, args):
+    results = []
+
+    def stage(name):
+        result = {'rows_total': rows, 'stage': name}
+        results.append(result)
+        print(f"  {name}...", flush=True)
+        return measure(result)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        # The database is always built; its upsert time is the ingest stage
+        with stage('ingest') as result:
+            generate_seconds, upsert_seconds = write_database(db_path, rows, chunksize=args.chunksize, seed=args.seed)
+            result['rows'] = rows
+        result['generate_seconds'] = generate_seconds
+        result['seconds'] = upsert_seconds
+        result['rows_per_second'] = rows / upsert_seconds
+        if 'ingest' not in stages:
+            results.pop()
+
+        data = cluster_results = None
+        if {'load', 'utm', 'dbscan', 'map'} & set(stages):
+            with stage('load') as result:
+                data = load_crimes(db_path, CLUSTER_COLUMNS)
+                result['rows'] = len(data)
+        if 'utm' in stages:
+            with stage('utm') as result:
+                project_to_utm(data['longitude'], data['latitude'])
+                result['rows'] = len(data)
+        if {'dbscan', 'map'} & set(stages):
+            with stage('dbscan') as result:
+                cluster_results = apply_dbscan(data, args.eps, args.min_samples, n_jobs=args.workers)
+                result['rows'] = len(data)
+                result['clusters'] = int(cluster_results['cluster'].max() + 1)
+        if 'map' in stages:
+            beats = beat_boundaries_geojson() if os.path.exists(BEAT_SHAPEFILE) else '{"type": "FeatureCollection", "features": []}'
+            with stage('map') as result:
+                create_map_with_cluster_size(data, cluster_results, beats, output_path=os.path.join(tmp, 'clusters.html'), open_browser=False)
+                result['rows'] = len(data)
+                result['html_mb'] = os.path.getsize(os.path.join(tmp, 'clusters.html')) / 2 ** 20
+        data = cluster_results = None
+
+        if 'anomalies' in stages:
+            with stage('anomalies') as result:
+                detector = AnomalyDetector(db_path)
+                result['rows'] = int(detector.crime_counts['count'].sum())
+                detector.anomalous_incidents
+                result['series_anomalies'] = len(detector.series_anomalies())
+        if 'prophet' in stages:
+            with stage('prophet') as result:
+                run_time_series_analysis(db_path, n_jobs=args.workers, cache_dir=os.path.join(tmp, 'prophet'))
+                result['rows'] = rows
+        if 'random_forest' in stages:
+            # The model trains on its default window, 2023
+            training_rows = int(load_daily_counts(db_path, start='2023-01-01', end='2024-01-01')['count'].sum())
+            with stage('random_forest') as result:
+                stats = run_decision_tree_analysis(db_path, ARREST_VARS, mode=args.arrest_mode)[2]
+                result['rows'] = training_rows
+                result['accuracy'] = float(stats.split()[1])
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+# Print each stage's time and peak memory next to the baseline's for the same size
+def compare(results, baseline):
+    current = pd.DataFrame(results).set_index(['rows_total', 'stage'])
+    previous = pd.DataFrame(baseline['results']).set_index(['rows_total', 'stage'])
+    joined = current[['seconds', 'peak_rss_mb']].join(previous[['seconds', 'peak_rss_mb']], rsuffix='_baseline', how='inner')
+    joined['time_ratio'] = joined['seconds'] / joined['seconds_baseline']
+    joined['memory_ratio'] = joined['peak_rss_mb'] / joined['peak_rss_mb_baseline']
+    print(f"\nAgainst baseline {baseline.get('commit')} ({baseline.get('created_at')}), ratio < 1 is better:")
+    print(joined.to_string(float_format=lambda value: f'{value:.2f}'))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1M', help='comma separated row counts, e.g. 1M,10M,50M')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"comma separated, from {','.join(STAGES)}")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None, help='earlier results file to compare against')
+    parser.add_argument('--chunksize', type=int, default=500000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--eps', type=float, default=0.5)
+    parser.add_argument('--min-samples', type=int, default=7)
+    parser.add_argument('--arrest-mode', default='smote')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--profile-log', default=None, help='JSON-lines file for the records of every profiled step')
+    args = parser.parse_args()
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    profiling.configure(log_path=args.profile_log)
+
+    stages = args.stages.split(',')
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    results = []
+    for rows in map(parse_rows, args.sizes.split(',')):
+        print(f"{rows:,} rows", flush=True)
+        results += run_size(rows, stages, args)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'arguments': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    columns = ['rows_total', 'stage', 'seconds', 'cpu_seconds', 'peak_rss_mb', 'rss_growth_mb', 'rows_per_second']
+    print(pd.DataFrame(results)[columns].to_string(index=False, float_format=lambda value: f'{value:.2f}'))
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
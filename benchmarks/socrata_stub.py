@@ -0,0 +1,99 @@
+# Local stand-in for the Socrata resource endpoint, for benchmarks and offline runs of the ingest pipeline.
+# It understands the subset of SoQL that DataCleaningPipeline sends: date-range and keyset $where
+# clauses, $order on date and id, $limit and $offset.
+
+import bisect
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DISTRICTS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 14, 15, 16, 17, 18, 19, 20, 22, 24, 25]
+PRIMARY_TYPES = ['THEFT', 'BATTERY', 'CRIMINAL DAMAGE', 'ASSAULT', 'DECEPTIVE PRACTICE', 'OTHER OFFENSE', 'MOTOR VEHICLE THEFT', 'NARCOTICS']
+LOCATIONS = ['STREET', 'RESIDENCE', 'APARTMENT', 'SIDEWALK', 'PARKING LOT/GARAGE(NON.RESID.)', 'SMALL RETAIL STORE']
+
+# Generate n records in the shape returned by the Crimes - 2001 to Present dataset
+def generate_records(n, start_date='2023-01-01', days=365, seed=42):
+    rnd = random.Random(seed)
+    start = time.mktime(time.strptime(start_date, '%Y-%m-%d'))
+    records = []
+    for i in range(n):
+        district = rnd.choice(DISTRICTS)
+        timestamp = time.localtime(start + rnd.random() * days * 86400)
+        records.append({
+            'id': str(10000000 + i),
+            'date': time.strftime('%Y-%m-%dT%H:%M:00.000', timestamp),
+            'primary_type': rnd.choice(PRIMARY_TYPES),
+            'description': 'SIMPLE',
+            'location_description': rnd.choice(LOCATIONS),
+            'beat': f'{district:02d}{rnd.randint(11, 34)}',
+            'arrest': rnd.random() < 0.15,
+            'domestic': rnd.random() < 0.2,
+            'district': f'{district:03d}',
+            'latitude': f'{41.65 + rnd.random() * 0.35:.9f}',
+            'longitude': f'{-87.85 + rnd.random() * 0.3:.9f}',
+        })
+    return records
+
+class SocrataStub:
+    def __init__(self, records, latency=0.0, port=0):
+        self.records = sorted(records, key=lambda r: (r['date'], int(r['id'])))
+        self.dates = [r['date'] for r in self.records]
+        self.latency = latency
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    @property
+    def domain(self):
+        return f'127.0.0.1:{self.server.server_address[1]}'
+    
+    def query(self, params):
+        where = params.get('$where', '')
+        match = re.search(r"date between '([^']*)' and '([^']*)'", where)
+        lo, hi = (match.group(1), match.group(2)) if match else ('', '￿')
+        rows = self.records[bisect.bisect_left(self.dates, lo):bisect.bisect_right(self.dates, hi)]
+        match = re.search(r"date > '([^']*)' or \(date = '([^']*)' and id > (\d+)\)", where)
+        if match:
+            last_date, last_id = match.group(1), int(match.group(3))
+            rows = [r for r in rows if r['date'] > last_date or (r['date'] == last_date and int(r['id']) > last_id)]
+        if 'DESC' in params.get('$order', ''):
+            rows = rows[::-1]
+        offset = int(params.get('$offset', 0))
+        limit = int(params.get('$limit', 1000))
+        return rows[offset:offset + limit]
+    
+    def make_handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                with stub.lock:
+                    stub.request_count += 1
+                time.sleep(stub.latency)
+                body = json.dumps(stub.query(params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
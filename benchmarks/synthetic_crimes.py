@@ -0,0 +1,129 @@
+# Synthetic incidents at any scale, shaped like my_crime_data_lol.csv.
+# Categories (type, description, location, arrest, domestic) and places (beat, district and
+# coordinates) are drawn together from the sample's rows, so their joint frequencies carry over;
+# coordinates are jittered and snapped to a ~50 m grid, like the block-level points of the real
+# feed. The sample only covers one day, so the timestamps follow fixed profiles instead: a slow
+# decline over the years, summer peaks, busier Fridays and Saturdays, and an overnight low. Only
+# the minutes come from the sample's time column.
+# Usage: python benchmarks/synthetic_crimes.py synthetic.db --rows 1000000
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crime_db import create_schema, project_to_utm
+from data_cleaning import DISTRICT_TO_AREA, DataCleaningPipeline
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'my_crime_data_lol.csv')
+
+# Relative incident rates by month (January first), weekday (Monday first) and hour
+MONTH_WEIGHTS = [0.82, 0.76, 0.88, 0.92, 1.04, 1.08, 1.14, 1.13, 1.05, 1.03, 0.95, 0.90]
+WEEKDAY_WEIGHTS = [0.98, 0.96, 0.97, 0.98, 1.06, 1.05, 1.00]
+HOUR_WEIGHTS = [
+    4.6, 3.2, 2.8, 2.2, 1.7, 1.5, 2.0, 2.8, 3.8, 4.4, 4.5, 4.6,
+    5.6, 4.9, 5.0, 5.1, 5.2, 5.3, 5.3, 5.1, 4.9, 4.5, 4.2, 3.8,
+]
+
+# Coordinate jitter (degrees, about 400 m) and the grid the points are snapped to (about 50 m)
+JITTER = 0.004
+GRID = 0.0005
+
+# The populated rows of the sample, with the columns the generator draws from
+def load_sample(path=SAMPLE_CSV):
+    sample = pd.read_csv(path, dtype=str).dropna(subset=['id', 'latitude', 'longitude'])
+    sample['minute'] = pd.to_numeric(sample['time'].str.split(':').str[0], errors='coerce').fillna(0).astype('int64')
+    return sample.reset_index(drop=True)
+
+# Probability of each day from start (inclusive) to end (exclusive)
+def day_weights(start, end, yearly_decline=0.03):
+    days = pd.date_range(start, end, freq='D', inclusive='left')
+    years = (days - days[0]).days.to_numpy() / 365.25
+    weights = np.array(MONTH_WEIGHTS)[days.month - 1] * np.array(WEEKDAY_WEIGHTS)[days.dayofweek] * (1 - yearly_decline) ** years
+    return days, weights / weights.sum()
+
+# Yield DataFrames of chunksize incidents, rows in total, in the form clean_data returns, so
+# they can go straight to upsert_records. Ids count up from first_id.
+def generate_chunks(rows, start='2014-01-01', end='2024-01-01', chunksize=500000, seed=0, first_id=1, sample=None):
+    sample = load_sample() if sample is None else sample
+    rng = np.random.default_rng(seed)
+    days, weights = day_weights(start, end)
+    day_seconds = (days - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    hours = np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS)
+    latitude = sample['latitude'].astype(float).to_numpy()
+    longitude = sample['longitude'].astype(float).to_numpy()
+    for offset in range(0, rows, chunksize):
+        n = min(chunksize, rows - offset)
+        picked = rng.integers(0, len(sample), n)
+        rows_drawn = sample.iloc[picked]
+        timestamp = (
+            day_seconds.to_numpy()[rng.choice(len(days), n, p=weights)]
+            + rng.choice(24, n, p=hours) * 3600
+            + rows_drawn['minute'].to_numpy() * 60
+        )
+        lat = np.round((latitude[picked] + rng.normal(0, JITTER, n)) / GRID) * GRID
+        lon = np.round((longitude[picked] + rng.normal(0, JITTER, n)) / GRID) * GRID
+        utm_x, utm_y = project_to_utm(pd.Series(lon), pd.Series(lat))
+        district = pd.to_numeric(rows_drawn['district'].to_numpy()).astype('int64')
+        yield pd.DataFrame({
+            'id': np.arange(first_id + offset, first_id + offset + n, dtype='int64'),
+            'timestamp': timestamp.astype('int64'),
+            'primary_type': rows_drawn['primary_type'].to_numpy(),
+            'description': rows_drawn['description'].to_numpy(),
+            'location_description': rows_drawn['location_description'].to_numpy(),
+            'beat': pd.array(pd.to_numeric(rows_drawn['beat'].to_numpy()), dtype='Int16'),
+            'arrest': rows_drawn['arrest'].astype('int8').to_numpy(),
+            'domestic': rows_drawn['domestic'].astype('int8').to_numpy(),
+            'district': pd.array(district, dtype='Int16'),
+            'latitude': lat,
+            'longitude': lon,
+            'utm_x': np.asarray(utm_x),
+            'utm_y': np.asarray(utm_y),
+            'area': pd.Series(district).map(DISTRICT_TO_AREA).to_numpy(),
+        })
+
+# Generate rows incidents into a crime database through the ingest upsert. Returns the seconds
+# spent generating and upserting.
+def write_database(db_path, rows, chunksize=500000, seed=0, **options):
+    pipeline = DataCleaningPipeline(db_path, beat_shapefile=None)
+    conn = sqlite3.connect(db_path)
+    create_schema(conn)
+    generate_seconds = upsert_seconds = 0.0
+    chunks = generate_chunks(rows, chunksize=chunksize, seed=seed, **options)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        generate_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        pipeline.upsert_records(conn, chunk)
+        upsert_seconds += time.perf_counter() - start
+    conn.close()
+    return generate_seconds, upsert_seconds
+
+# Row counts such as 1M, 250k or 50000
+def parse_rows(value):
+    value = value.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(value[-1], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('db_path')
+    parser.add_argument('--rows', type=parse_rows, default=parse_rows('1M'))
+    parser.add_argument('--start', default='2014-01-01')
+    parser.add_argument('--end', default='2024-01-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_seconds, upsert_seconds = write_database(args.db_path, args.rows, seed=args.seed, start=args.start, end=args.end)
+    print(f"{args.rows:,} rows: generated in {generate_seconds:.1f}s, upserted in {upsert_seconds:.1f}s")
+
+if __name__ == "__main__":
+    main()
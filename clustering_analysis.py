@@ -1,85 +1,189 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import sqlite3
+from crime_db import load_crimes, project_to_utm
+from beat_boundaries import add_beat_layer, beat_boundaries_geojson
+from profiling import profiled, stage
 from sklearn.cluster import DBSCAN
 import folium
 import seaborn as sns
 import geopandas as gpd
-import pyproj
+import shapely
 import matplotlib.pyplot as plt
 from pandas.plotting import table
 import webbrowser
 
+# Columns the clustering reads
+CLUSTER_COLUMNS = ['id', 'datetime', 'primary_type', 'district', 'latitude', 'longitude', 'utm_x', 'utm_y']
+
 # Function to load data from the database
-def load_data(db_path):
-    conn = sqlite3.connect(db_path)
-    query = "SELECT * FROM crimes"
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    data['datetime'] = pd.to_datetime(data['date'] + ' ' + data['time'])
-    return data
+@profiled('clustering.load', rows_out=len)
+def load_data(db_path, start=None, end=None):
+    return load_crimes(db_path, CLUSTER_COLUMNS, start=start, end=end)
 
-# Function to convert latitude and longitude to UTM coordinates
+# Function to convert latitude and longitude to UTM coordinates.
+# Rows loaded from the database already carry utm_x/utm_y from ingest, so projection only
+# runs for frames that lack them.
+@profiled('clustering.utm', rows_in=lambda data: len(data), rows_out=len)
 def convert_to_utm(data):
-    data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
-    data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
     data = data.dropna(subset=['latitude', 'longitude'])
-    
-    proj_utm = pyproj.Proj(proj='utm', zone=16, ellps='WGS84', south=False)
-    data['utm_x'], data['utm_y'] = proj_utm(data['longitude'].values, data['latitude'].values)
+    if 'utm_x' not in data or 'utm_y' not in data or data[['utm_x', 'utm_y']].isna().any().any():
+        utm_x, utm_y = project_to_utm(pd.to_numeric(data['longitude'], errors='coerce'), pd.to_numeric(data['latitude'], errors='coerce'))
+        data = data.assign(utm_x=utm_x, utm_y=utm_y)
     return data
 
+# Fit DBSCAN on one district's coordinates; runs in a worker process.
+# The k-d tree keeps the radius neighbour search well below quadratic in the number of points.
+def fit_district_clusters(coordinates, eps, min_samples):
+    dbscan = DBSCAN(eps=eps, min_samples=min_samples, algorithm='kd_tree')
+    return dbscan.fit_predict(coordinates)
+
+# Cluster every district independently and return one label per row of data.
+# District fits run in a process pool (largest first) and their labels are offset so that
+# cluster ids are unique across districts; noise stays -1.
+def cluster_districts(data, eps, min_samples, n_jobs=None):
+    coordinates = data[['utm_x', 'utm_y']].to_numpy()
+    groups = data.groupby('district', sort=True).indices
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(groups)) or 1
+    if n_jobs == 1:
+        district_labels = {district: fit_district_clusters(coordinates[rows], eps, min_samples) for district, rows in groups.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {
+                district: executor.submit(fit_district_clusters, coordinates[rows], eps, min_samples)
+                for district, rows in sorted(groups.items(), key=lambda item: -len(item[1]))
+            }
+            district_labels = {district: future.result() for district, future in futures.items()}
+
+    labels = np.full(len(data), -1, dtype=np.int64)
+    offset = 0
+    for district, rows in groups.items():
+        fitted = district_labels[district]
+        clustered = fitted >= 0
+        labels[rows[clustered]] = fitted[clustered] + offset
+        if clustered.any():
+            offset += fitted.max() + 1
+    return labels
+
+# Most frequent crime type in each cluster, ties broken alphabetically like Series.mode
+def top_crime_types(cluster_results):
+    counts = cluster_results.groupby(['cluster', 'primary_type'], observed=True).size().reset_index(name='count')
+    counts = counts.sort_values(['cluster', 'count', 'primary_type'], ascending=[True, False, True])
+    return counts.drop_duplicates('cluster').set_index('cluster')['primary_type'].astype(str)
+
 # Function to apply DBSCAN clustering
-def apply_dbscan(data, eps, min_samples):
-    cluster_results = pd.DataFrame()
-    for district in data['district'].unique():
-        subset = data[data['district'] == district]
-        coordinates = subset[['utm_x', 'utm_y']].values
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-        subset['cluster'] = dbscan.fit_predict(coordinates)
-        cluster_results = pd.concat([cluster_results, subset])
+@profiled('clustering.dbscan', rows_in=lambda data, *args, **kwargs: len(data), rows_out=len)
+def apply_dbscan(data, eps, min_samples, n_jobs=None):
+    data = data[data['district'].notna()].reset_index(drop=True)
+    cluster_results = data.assign(cluster=cluster_districts(data, eps, min_samples, n_jobs))
 
     # Calculate top crime type for each cluster
-    top_crime_types = cluster_results.groupby('cluster')['primary_type'].agg(lambda x: x.mode()[0] if not x.mode().empty else 'N/A')
-    cluster_results = cluster_results.merge(top_crime_types.rename('top_crime_type'), on='cluster', how='left')
+    cluster_results['top_crime_type'] = cluster_results['cluster'].map(top_crime_types(cluster_results))
     
     return cluster_results
 
-# Updated function to create map with cluster sizes
-def create_map_with_cluster_size(data, cluster_results, beat_boundaries):
+# One row per cluster (noise excluded): centroid, size, district and top crime type
+def summarize_clusters(cluster_results):
+    clustered = cluster_results[cluster_results['cluster'] != -1]
+    summary = clustered.groupby('cluster').agg(
+        latitude=('latitude', 'mean'),
+        longitude=('longitude', 'mean'),
+        size=('cluster', 'size'),
+        district=('district', 'first'),
+        top_crime_type=('top_crime_type', 'first'),
+    ).reset_index()
+    summary['district'] = summary['district'].astype(int)
+    return summary
+
+# Convex hull of every cluster's incidents, built in one vectorized shapely call.
+# Returned in the same order as summarize_clusters (sorted by cluster id).
+def cluster_hulls(cluster_results):
+    clustered = cluster_results[cluster_results['cluster'] != -1].sort_values('cluster', kind='stable')
+    codes, _ = pd.factorize(clustered['cluster'], sort=True)
+    points = shapely.multipoints(clustered[['longitude', 'latitude']].to_numpy(), indices=codes)
+    return shapely.convex_hull(points)
+
+# GeoJSON FeatureCollection with one feature per cluster, as a centroid point or a convex hull
+def clusters_to_geojson(summary, hulls=None):
+    geometry = hulls if hulls is not None else gpd.points_from_xy(summary['longitude'], summary['latitude'])
+    features = gpd.GeoDataFrame(summary[['cluster', 'district', 'size', 'top_crime_type']], geometry=geometry, crs='EPSG:4326')
+    return features.to_json()
+
+# Add the clusters to the map as GeoJSON layers, optionally one toggleable layer per district
+def add_cluster_layers(map, summary, district_colors, hulls=None, district_layers=True):
+    def style(feature):
+        color = district_colors[feature['properties']['district']]
+        return {
+            'color': color,
+            'fillColor': color,
+            'fillOpacity': 0.3,
+            'weight': 1,
+            'radius': min(3 + feature['properties']['size'] / 60, 40),  # Adjust size based on cluster size
+        }
+    
+    groups = summary.groupby('district').indices.items() if district_layers else [(None, np.arange(len(summary)))]
+    for district, rows in groups:
+        layer = folium.FeatureGroup(name=f'District {district}') if district is not None else map
+        folium.GeoJson(
+            clusters_to_geojson(summary.iloc[rows], None if hulls is None else hulls[rows]),
+            marker=folium.CircleMarker(fill=True),
+            style_function=style,
+            popup=folium.GeoJsonPopup(fields=['district', 'cluster', 'size', 'top_crime_type'], aliases=['District', 'Cluster', 'Size', 'Top Crime']),
+        ).add_to(layer)
+        if district is not None:
+            layer.add_to(map)
+    if district_layers:
+        folium.LayerControl(collapsed=False).add_to(map)
+
+# Updated function to create map with cluster sizes.
+# mode='clusters' draws one feature per cluster (centroid, or convex hull with hulls=True), so the
+# map grows with the number of clusters; mode='incidents' draws every clustered incident.
+@profiled('clustering.map', rows_in=lambda data, cluster_results, *args, **kwargs: len(cluster_results))
+def create_map_with_cluster_size(data, cluster_results, beat_boundaries, mode='clusters', hulls=False, district_layers=True, output_path='Chicago_crime_clusters_with_cluster_size.html', open_browser=True):
     map = folium.Map(location=[data['latitude'].mean(), data['longitude'].mean()], zoom_start=11)
-    district_colors = sns.color_palette('hsv', len(data['district'].unique())).as_hex()
+    districts = data['district'].dropna().unique()
+    district_colors = dict(zip((int(d) for d in districts), sns.color_palette('hsv', len(districts)).as_hex()))
     
-    # Calculate cluster sizes
-    cluster_sizes = cluster_results['cluster'].value_counts().to_dict()
+    add_beat_layer(map, beat_boundaries)
     
-    for idx, row in cluster_results.iterrows():
-        if row['cluster'] != -1:
-            district_index = list(data['district'].unique()).index(row['district'])
-            cluster_color = district_colors[district_index]
-            cluster_size = cluster_sizes[row['cluster']] / 3
-            top_crime_type = row['top_crime_type']
+    if mode == 'clusters':
+        summary = summarize_clusters(cluster_results)
+        if len(summary):
+            add_cluster_layers(map, summary, district_colors, cluster_hulls(cluster_results) if hulls else None, district_layers)
+    else:
+        # Calculate cluster sizes
+        cluster_sizes = cluster_results['cluster'].value_counts().to_dict()
+        
+        for row in cluster_results[cluster_results['cluster'] != -1].itertuples(index=False):
+            cluster_color = district_colors[int(row.district)]
+            cluster_size = cluster_sizes[row.cluster] / 3
             folium.CircleMarker(
-                [row['latitude'], row['longitude']],
+                [row.latitude, row.longitude],
                 radius=3 + cluster_size / 20,  # Adjust size based on cluster size
                 color=cluster_color,
                 fill=True,
                 fill_color=cluster_color,
                 fill_opacity=0.1,
-                popup=f'District: {row["district"]}, Cluster: {row["cluster"]}, Size: {cluster_size}, Top Crime: {top_crime_type}'
+                popup=f'District: {row.district}, Cluster: {row.cluster}, Size: {cluster_size}, Top Crime: {row.top_crime_type}'
             ).add_to(map)
     
-    for idx, row in beat_boundaries.iterrows():
-        folium.GeoJson(row['geometry']).add_to(map)
-    
-    map.save('Chicago_crime_clusters_with_cluster_size.html')
-    webbrowser.open('Chicago_crime_clusters_with_cluster_size.html')
+    map.save(output_path)
+    if open_browser:
+        webbrowser.open(output_path)
 
-def run_analysis(db_path):
+# crimes: incidents already loaded with CLUSTER_COLUMNS, used instead of reading the database.
+# Returns the cluster summary.
+def run_analysis(db_path, crimes=None, output_path='Chicago_crime_clusters_with_cluster_size.html', open_browser=True):
     eps = 0.5  # Adjust based on your data
     min_samples = 7  # Adjust based on your data
-    data = load_data(db_path)
-    data = convert_to_utm(data)
-    cluster_results = apply_dbscan(data, eps, min_samples)
-    beat_boundaries = gpd.read_file('boundaries/geo_export_0b908a58-99fc-452e-866d-07ad3860c3ca.shp')
-    create_map_with_cluster_size(data, cluster_results, beat_boundaries)
+    with stage('clustering.run') as current:
+        data = load_data(db_path) if crimes is None else crimes[CLUSTER_COLUMNS]
+        current.rows_in = len(data)
+        data = convert_to_utm(data)
+        cluster_results = apply_dbscan(data, eps, min_samples)
+        beat_boundaries = beat_boundaries_geojson()
+        create_map_with_cluster_size(data, cluster_results, beat_boundaries, output_path=output_path, open_browser=open_browser)
+        summary = summarize_clusters(cluster_results)
+        current.rows_out = len(summary)
+    return summary
@@ -0,0 +1,415 @@
+import json
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import pyproj
+
+# Schema of the crime database.
+# timestamp holds the Chicago wall-clock time of the incident as seconds since 1970-01-01, with the
+# local time treated as if it were UTC, so timestamp // 86400 is the local calendar day.
+# primary_type and location_description are stored as integer codes into lookup tables;
+# crimes_view joins them back to their names for ad-hoc SQL.
+# utm_x/utm_y are the coordinates projected to UTM zone 16N (metres), computed once at ingest.
+
+CREATE_LOOKUP_TABLES = """
+CREATE TABLE IF NOT EXISTS primary_types (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS location_descriptions (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+"""
+
+# The primary key on id is what lets new and changed rows be upserted in place
+CREATE_CRIMES_TABLE = """
+CREATE TABLE IF NOT EXISTS crimes (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER,
+    primary_type_id INTEGER REFERENCES primary_types(id),
+    description TEXT,
+    location_description_id INTEGER REFERENCES location_descriptions(id),
+    beat INTEGER,
+    arrest INTEGER,
+    domestic INTEGER,
+    district INTEGER,
+    latitude REAL,
+    longitude REAL,
+    area TEXT,
+    utm_x REAL,
+    utm_y REAL
+);
+CREATE INDEX IF NOT EXISTS idx_crimes_timestamp ON crimes(timestamp);
+CREATE INDEX IF NOT EXISTS idx_crimes_district_timestamp ON crimes(district, timestamp);
+CREATE INDEX IF NOT EXISTS idx_crimes_area_timestamp ON crimes(area, timestamp);
+"""
+
+CREATE_CRIMES_VIEW = """
+DROP VIEW IF EXISTS crimes_view;
+CREATE VIEW crimes_view AS
+SELECT
+    c.id,
+    c.timestamp,
+    date(c.timestamp, 'unixepoch') AS date,
+    time(c.timestamp, 'unixepoch') AS time,
+    pt.name AS primary_type,
+    c.description,
+    ld.name AS location_description,
+    CASE WHEN c.beat IS NOT NULL THEN printf('%04d', c.beat) END AS beat,
+    c.arrest,
+    c.domestic,
+    c.district,
+    c.latitude,
+    c.longitude,
+    c.area
+FROM crimes c
+LEFT JOIN primary_types pt ON pt.id = c.primary_type_id
+LEFT JOIN location_descriptions ld ON ld.id = c.location_description_id;
+"""
+
+# Keyset cursor (date, id) of the last page written for an in-progress pull
+CREATE_CHECKPOINTS_TABLE = """
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    dataset TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    last_date TEXT,
+    last_id INTEGER,
+    PRIMARY KEY (dataset, start_date, end_date)
+);
+"""
+
+# Incidents per calendar day and (area, district, beat, primary type), kept in step with crimes by
+# the ingest path so daily series can be read without scanning incidents. day is timestamp // 86400.
+CREATE_DAILY_COUNTS_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_counts (
+    day INTEGER NOT NULL,
+    area TEXT,
+    district INTEGER,
+    beat INTEGER,
+    primary_type_id INTEGER REFERENCES primary_types(id),
+    n INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_daily_counts_day ON daily_counts(day);
+"""
+
+# Columns daily_counts can be grouped by
+DAILY_COUNT_KEYS = ['area', 'district', 'beat', 'primary_type_id']
+
+# Count incidents per day and key; condition narrows the scan to a timestamp range
+REFRESH_DAILY_COUNTS = """
+INSERT INTO daily_counts (day, area, district, beat, primary_type_id, n)
+SELECT timestamp / 86400 AS day, area, district, beat, primary_type_id, COUNT(*)
+FROM crimes
+WHERE timestamp IS NOT NULL {condition}
+GROUP BY day, area, district, beat, primary_type_id
+"""
+
+# Backtest errors per series and fold; a fold is a backend forecasting horizon days from cutoff
+# after training on the train_days before it (0 for all history)
+CREATE_FORECAST_METRICS_TABLE = """
+CREATE TABLE IF NOT EXISTS forecast_metrics (
+    grouping TEXT NOT NULL,
+    series TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    cutoff TEXT NOT NULL,
+    horizon INTEGER NOT NULL,
+    train_days INTEGER NOT NULL,
+    mae REAL,
+    rmse REAL,
+    mape REAL,
+    fit_seconds REAL,
+    run_at TEXT,
+    PRIMARY KEY (grouping, backend, cutoff, horizon, train_days, series)
+);
+"""
+
+# Columns of the crimes table, in the order they are written
+CRIME_COLUMNS = ['id', 'timestamp', 'primary_type_id', 'description', 'location_description_id', 'beat', 'arrest', 'domestic', 'district', 'latitude', 'longitude', 'area', 'utm_x', 'utm_y']
+
+# Lookup table for each coded column
+LOOKUP_TABLES = {
+    'primary_type': 'primary_types',
+    'location_description': 'location_descriptions',
+}
+
+# One-time migration of databases written before the typed schema, where date and time were
+# text columns and primary_type/location_description were stored inline
+MIGRATE_LEGACY_CRIMES = """
+ALTER TABLE crimes RENAME TO crimes_legacy;
+{create_crimes}
+INSERT OR IGNORE INTO primary_types (name)
+    SELECT DISTINCT primary_type FROM crimes_legacy WHERE primary_type IS NOT NULL;
+INSERT OR IGNORE INTO location_descriptions (name)
+    SELECT DISTINCT location_description FROM crimes_legacy WHERE location_description IS NOT NULL;
+INSERT OR REPLACE INTO crimes ({columns})
+SELECT
+    CAST(l.id AS INTEGER),
+    CAST(COALESCE(strftime('%s', l.date || ' ' || substr(l.time, 1, 8)), strftime('%s', l.date)) AS INTEGER),
+    pt.id,
+    l.description,
+    ld.id,
+    CAST(l.beat AS INTEGER),
+    CASE WHEN l.arrest IN (1, '1', 'true', 'True') THEN 1 ELSE 0 END,
+    CASE WHEN l.domestic IN (1, '1', 'true', 'True') THEN 1 ELSE 0 END,
+    CAST(l.district AS INTEGER),
+    CAST(l.latitude AS REAL),
+    CAST(l.longitude AS REAL),
+    l.area,
+    NULL,
+    NULL
+FROM crimes_legacy l
+LEFT JOIN primary_types pt ON pt.name = l.primary_type
+LEFT JOIN location_descriptions ld ON ld.name = l.location_description;
+DROP TABLE crimes_legacy;
+"""
+
+# WGS84 latitude/longitude to UTM zone 16N, which covers Chicago
+UTM_TRANSFORMER = pyproj.Transformer.from_crs('EPSG:4326', 'EPSG:32616', always_xy=True)
+
+# Project longitude/latitude arrays to UTM metres; missing coordinates stay NaN
+def project_to_utm(longitude, latitude):
+    longitude = np.asarray(longitude, dtype='float64')
+    latitude = np.asarray(latitude, dtype='float64')
+    utm_x = np.full(len(longitude), np.nan)
+    utm_y = np.full(len(latitude), np.nan)
+    valid = ~(np.isnan(longitude) | np.isnan(latitude))
+    utm_x[valid], utm_y[valid] = UTM_TRANSFORMER.transform(longitude[valid], latitude[valid])
+    return utm_x, utm_y
+
+# Fill utm_x/utm_y for existing rows, walking the table in id order a chunk at a time
+def backfill_utm(conn, chunksize=100000):
+    last_id = -1
+    while True:
+        rows = conn.execute("SELECT id, longitude, latitude FROM crimes WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunksize)).fetchall()
+        if not rows:
+            break
+        ids, longitude, latitude = zip(*rows)
+        utm_x, utm_y = project_to_utm([np.nan if v is None else v for v in longitude], [np.nan if v is None else v for v in latitude])
+        with conn:
+            conn.executemany(
+                "UPDATE crimes SET utm_x = ?, utm_y = ? WHERE id = ?",
+                [(None if np.isnan(x) else float(x), None if np.isnan(y) else float(y), i) for x, y, i in zip(utm_x, utm_y, ids)]
+            )
+        last_id = ids[-1]
+
+# Convert a date string such as '2023-01-01' or '2023-01-01 12:30' to the timestamp encoding above
+def to_epoch(value):
+    return int((pd.Timestamp(value) - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+
+def column_names(conn, table):
+    return [col[1] for col in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+# Bumped whenever the schema below changes. A file whose user_version matches is left alone, so
+# opening it takes no write lock.
+SCHEMA_VERSION = 1
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Create the schema, migrating a legacy crimes table first if there is one. Does nothing when
+# the file is already at SCHEMA_VERSION.
+def create_schema(conn):
+    if schema_version(conn) == SCHEMA_VERSION:
+        return
+    columns = column_names(conn, 'crimes')
+    has_daily_counts = bool(column_names(conn, 'daily_counts'))
+    if columns and 'timestamp' not in columns:
+        conn.execute("DROP VIEW IF EXISTS crimes_view")
+        conn.executescript(CREATE_LOOKUP_TABLES)
+        try:
+            conn.executescript("BEGIN;" + MIGRATE_LEGACY_CRIMES.format(create_crimes=CREATE_CRIMES_TABLE, columns=', '.join(CRIME_COLUMNS)) + "COMMIT;")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        backfill_utm(conn)
+    elif columns and 'utm_x' not in columns:
+        with conn:
+            conn.execute("ALTER TABLE crimes ADD COLUMN utm_x REAL")
+            conn.execute("ALTER TABLE crimes ADD COLUMN utm_y REAL")
+        backfill_utm(conn)
+    conn.executescript(CREATE_LOOKUP_TABLES + CREATE_CRIMES_TABLE + CREATE_CRIMES_VIEW + CREATE_CHECKPOINTS_TABLE + CREATE_DAILY_COUNTS_TABLE + CREATE_FORECAST_METRICS_TABLE)
+    if columns and not has_daily_counts:
+        rebuild_daily_counts(conn)
+    # In WAL mode readers and the one writer do not block each other; the mode is kept in the file
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+# Recount every day, e.g. for a database written before daily_counts existed
+def rebuild_daily_counts(conn):
+    with conn:
+        conn.execute("DELETE FROM daily_counts")
+        conn.execute(REFRESH_DAILY_COUNTS.format(condition=""))
+
+# Recount the given calendar days (timestamp // 86400) after their incidents changed.
+# Runs in the caller's transaction; each day is a range lookup on the timestamp index.
+def refresh_daily_counts(conn, days):
+    days = sorted({int(day) for day in days})
+    if not days:
+        return
+    conn.execute("DELETE FROM daily_counts WHERE day IN (SELECT value FROM json_each(?))", (json.dumps(days),))
+    for day in days:
+        conn.execute(REFRESH_DAILY_COUNTS.format(condition="AND timestamp >= ? AND timestamp < ?"), (day * 86400, (day + 1) * 86400))
+
+# Days touched by the given incident ids as currently stored
+def stored_days(conn, ids):
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT timestamp / 86400 FROM crimes WHERE id IN (SELECT value FROM json_each(?)) AND timestamp IS NOT NULL",
+        (json.dumps([int(i) for i in ids]),)
+    )]
+
+# Empty the crimes table and everything derived from it
+def drop_crimes(conn):
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS crimes")
+        conn.execute("DROP TABLE IF EXISTS daily_counts")
+        conn.execute("PRAGMA user_version = 0")
+    create_schema(conn)
+
+# Open the database with the typed schema in place
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    create_schema(conn)
+    return conn
+
+# Open the database for the read paths. Only a file written before SCHEMA_VERSION gets the
+# schema brought up to date, and one that cannot be written is read as it is.
+def connect_reader(db_path):
+    conn = sqlite3.connect(db_path)
+    if schema_version(conn) != SCHEMA_VERSION:
+        try:
+            create_schema(conn)
+        except sqlite3.OperationalError:
+            if os.access(db_path, os.W_OK):
+                conn.close()
+                raise
+    return conn
+
+# Map names to their lookup codes, adding any names not seen before
+def encode_lookup(conn, table, names):
+    names = [name for name in pd.unique(names.dropna())]
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in names])
+    rows = conn.execute(f"SELECT name, id FROM {table} WHERE name IN (SELECT value FROM json_each(?))", (json.dumps(names),)).fetchall()
+    return dict(rows)
+
+# Compact in-memory dtypes for each column returned by load_crimes
+COLUMN_DTYPES = {
+    'id': 'int64',
+    'timestamp': 'int64',
+    'beat': 'Int16',
+    'district': 'Int16',
+    'arrest': 'int8',
+    'domestic': 'int8',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'utm_x': 'float64',
+    'utm_y': 'float64',
+    'description': 'category',
+    'area': 'category',
+}
+
+# Columns derived from other columns after loading
+DERIVED_COLUMNS = {
+    'datetime': 'timestamp',
+    'primary_type': 'primary_type_id',
+    'location_description': 'location_description_id',
+}
+
+# Name to code of every lookup-coded column, e.g. {'primary_type': {'THEFT': 1, ...}, ...}
+def lookup_codes(db_path):
+    conn = connect_reader(db_path)
+    codes = {column: {name: code for code, name in conn.execute(f"SELECT id, name FROM {table}")} for column, table in LOOKUP_TABLES.items()}
+    conn.close()
+    return codes
+
+# Replace integer lookup codes with a categorical of their names
+def decode_lookup(conn, table, codes):
+    names = dict(conn.execute(f"SELECT id, name FROM {table}").fetchall())
+    categories = codes.astype('category')
+    return categories.cat.rename_categories([names[int(code)] for code in categories.cat.categories])
+
+# Load incidents with only the requested columns and with the date/district/area filters applied in SQL.
+# start is inclusive and end is exclusive; days restricts the result to a list of calendar days.
+# Besides the table columns, 'datetime' (parsed from timestamp) and the names
+# 'primary_type'/'location_description' can be requested; names come back as categoricals.
+def load_crimes(db_path, columns=None, start=None, end=None, districts=None, areas=None, days=None, chunksize=200000):
+    columns = list(columns) if columns else [c for c in CRIME_COLUMNS if not c.endswith('_id')] + list(LOOKUP_TABLES)
+    stored_columns = list(dict.fromkeys(DERIVED_COLUMNS.get(col, col) for col in columns))
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(to_epoch(start))
+    if end is not None:
+        conditions.append("timestamp < ?")
+        params.append(to_epoch(end))
+    if districts is not None:
+        conditions.append(f"district IN ({', '.join('?' * len(districts))})")
+        params.extend(int(d) for d in districts)
+    if areas is not None:
+        conditions.append(f"area IN ({', '.join('?' * len(areas))})")
+        params.extend(areas)
+    if days is not None:
+        # One timestamp range per day, so each range is still an index lookup
+        conditions.append("(" + " OR ".join(["(timestamp >= ? AND timestamp < ?)"] * len(days)) + ")" if len(days) else "0")
+        for day in days:
+            params.extend([to_epoch(day), to_epoch(day) + 86400])
+    query = f"SELECT {', '.join(stored_columns)} FROM crimes"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    conn = connect_reader(db_path)
+    # Downcast chunk by chunk so the full result is never held with wide dtypes
+    dtypes = {col: COLUMN_DTYPES[col] for col in stored_columns if col in COLUMN_DTYPES and COLUMN_DTYPES[col] != 'category'}
+    chunks = [chunk.astype(dtypes) for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunksize)]
+    data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=stored_columns).astype(dtypes)
+    for col in stored_columns:
+        if COLUMN_DTYPES.get(col) == 'category':
+            data[col] = data[col].astype('category')
+
+    for column, table in LOOKUP_TABLES.items():
+        if column in columns:
+            data[column] = decode_lookup(conn, table, data[f'{column}_id'])
+    conn.close()
+    if 'datetime' in columns:
+        data['datetime'] = pd.to_datetime(data['timestamp'], unit='s')
+    return data[columns]
+
+# Number of incidents on each calendar day, summed from daily_counts.
+# With by (e.g. ['district', 'primary_type']) there is one count per day and group instead; groupings
+# daily_counts does not keep are counted from crimes.
+def load_daily_counts(db_path, start=None, end=None, by=None):
+    by = list(by) if by else []
+    stored_by = [DERIVED_COLUMNS.get(col, col) for col in by]
+    # Whole days only: a bound inside a day is rounded up to the next midnight
+    bounds = [(-(-to_epoch(value) // 86400), op) for value, op in [(start, '>='), (end, '<')] if value is not None]
+    if all(col in DAILY_COUNT_KEYS for col in stored_by):
+        table, day, count = "daily_counts", "day", "SUM(n)"
+        conditions = [f"day {op} ?" for _, op in bounds]
+        params = [bound for bound, _ in bounds]
+    else:
+        table, day, count = "crimes", "timestamp / 86400", "COUNT(*)"
+        conditions = ["timestamp IS NOT NULL"] + [f"timestamp {op} ?" for _, op in bounds]
+        params = [bound * 86400 for bound, _ in bounds]
+    group = ", ".join(stored_by + ["day"])
+    query = f"SELECT {''.join(col + ', ' for col in stored_by)}{day} AS day, {count} AS count FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" GROUP BY {group} ORDER BY {group}"
+    conn = connect_reader(db_path)
+    counts = pd.read_sql_query(query, conn, params=params)
+    for column, table in LOOKUP_TABLES.items():
+        if column in by:
+            counts[column] = decode_lookup(conn, table, counts[f'{column}_id'])
+    conn.close()
+    counts['date'] = pd.to_datetime(counts['day'], unit='D')
+    return counts[by + ['date', 'count']]
+
+# load_daily_counts for incidents already in memory, which need timestamp and the by columns
+def count_by_day(crimes, by=None):
+    by = list(by) if by else []
+    counts = crimes.assign(day=crimes['timestamp'] // 86400).groupby(by + ['day'], observed=True, dropna=False).size().reset_index(name='count')
+    counts['date'] = pd.to_datetime(counts['day'], unit='D')
+    return counts[by + ['date', 'count']]
@@ -1,77 +1,336 @@
 import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import requests
 from sodapy import Socrata
 import pandas as pd
 import sqlite3
+from crime_db import CRIME_COLUMNS, LOOKUP_TABLES, create_schema, drop_crimes, encode_lookup, project_to_utm, refresh_daily_counts, stored_days
+from beat_boundaries import BEAT_SHAPEFILE, assign_beats
+from profiling import profiled, stage
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 
+DISTRICT_TO_AREA = {
+    2: 'Area Central', 3: 'Area Central', 7: 'Area Central', 8: 'Area Central', 9: 'Area Central',
+    4: 'Area South', 5: 'Area South', 6: 'Area South',
+    1: 'Area North', 10: 'Area North', 11: 'Area North', 12: 'Area North', 14: 'Area North', 15: 'Area North', 16: 'Area North', 17: 'Area North', 18: 'Area North', 19: 'Area North', 20: 'Area North', 22: 'Area North', 24: 'Area North', 25: 'Area North'
+}
+
+UPSERT_CRIMES = (
+    f"INSERT INTO crimes ({', '.join(CRIME_COLUMNS)}) VALUES ({', '.join('?' * len(CRIME_COLUMNS))}) "
+    f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{col} = excluded.{col}' for col in CRIME_COLUMNS[1:])} "
+    # Only touch rows whose contents actually changed
+    f"WHERE {' OR '.join(f'crimes.{col} IS NOT excluded.{col}' for col in CRIME_COLUMNS[1:])}"
+)
+
+# Split a date range into consecutive, non-overlapping windows (calendar months by default)
+def split_date_range(start_date, end_date, freq='MS'):
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    boundaries = [start] + [b for b in pd.date_range(start, end, freq=freq) if start < b <= end]
+    windows = []
+    for i, window_start in enumerate(boundaries):
+        if i + 1 < len(boundaries):
+            window_end = boundaries[i + 1] - pd.Timedelta(milliseconds=1)
+        else:
+            window_end = end
+        windows.append((window_start.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3], window_end.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]))
+    return windows
+
+# Spaces requests evenly so that all threads together stay under requests_per_second
+class RateLimiter:
+    def __init__(self, requests_per_second=None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        time.sleep(start - now)
+
 class DataCleaningPipeline:
-    def __init__(self, db_name='crime_data.db'):
+    def __init__(self, db_name='crime_data.db', domain='data.cityofchicago.org', uri_prefix='https://', beat_shapefile=BEAT_SHAPEFILE):
         self.app_token = os.getenv('9qtnj62620uvn8aqz1p7kjlte')
         self.username = os.getenv('123104372@umail.ucc.ie')
         self.password = os.getenv('daqkoh-9rydby-xepSep')
         self.db_name = db_name
-        self.client = Socrata("data.cityofchicago.org", self.app_token, username=self.username, password=self.password)
+        self.domain = domain
+        self.uri_prefix = uri_prefix
+        self.beat_shapefile = beat_shapefile
+        self._client = None
+        self.thread_clients = threading.local()
+    
+    # Created on first use, so a pipeline that never fetches opens no connection
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.make_client()
+        return self._client
+    
+    # Each client keeps its own pooled, keep-alive HTTP session.
+    # uri_prefix='http://' lets the pipeline talk to a local stand-in for the Socrata endpoint.
+    def make_client(self, pool_size=10):
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        return Socrata(self.domain, self.app_token, username=self.username, password=self.password,
+                       session_adapter={'prefix': self.uri_prefix, 'adapter': adapter})
+    
+    # requests.Session is not thread-safe, so worker threads get a client of their own
+    def get_thread_client(self):
+        if not hasattr(self.thread_clients, 'client'):
+            self.thread_clients.client = self.make_client()
+        return self.thread_clients.client
+    
+    # Request one page, retrying failed requests with exponential backoff
+    def get_page(self, dataset_identifier, client=None, rate_limiter=None, retries=3, backoff=1.0, **params):
+        client = client or self.client
+        for attempt in range(retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            try:
+                return client.get(dataset_identifier, **params)
+            except requests.exceptions.RequestException:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
         
-    def fetch_records_in_date_range(self, dataset_identifier, start_date, end_date, page_size=100000):
-        records_fetched = 0
-        start_offset = 0
-        all_records = []
+    # Yield the records in the date range one page at a time.
+    # Pages are walked with a keyset cursor on (date, id) rather than an offset, so deep pages
+    # cost the same as the first one and a pull can resume from any cursor.
+    def iter_record_pages(self, dataset_identifier, start_date, end_date, page_size=100000, cursor=None, client=None, rate_limiter=None):
         while True:
-            results = self.client.get(
+            where = f"date between '{start_date}' and '{end_date}'"
+            if cursor is not None:
+                last_date, last_id = cursor
+                where += f" and (date > '{last_date}' or (date = '{last_date}' and id > {last_id}))"
+            results = self.get_page(
                 dataset_identifier, 
+                client=client,
+                rate_limiter=rate_limiter,
                 limit=page_size, 
-                offset=start_offset, 
-                where=f"date between '{start_date}' and '{end_date}'",
-                order='date DESC'
+                where=where,
+                order='date ASC, id ASC'
             )
             if not results:
                 break
+            cursor = (results[-1]['date'], int(results[-1]['id']))
+            yield results, cursor
+            if len(results) < page_size:
+                break
+    
+    def fetch_records_in_date_range(self, dataset_identifier, start_date, end_date, page_size=100000, client=None, rate_limiter=None):
+        all_records = []
+        for results, _ in self.iter_record_pages(dataset_identifier, start_date, end_date, page_size, client=client, rate_limiter=rate_limiter):
             all_records.extend(results)
-            records_fetched += len(results)
-            start_offset += page_size
         return all_records
     
+    @profiled('ingest.clean', rows_in=lambda self, df: len(df), rows_out=len)
     def clean_data(self, df):
         columns_to_keep = ['id', 'date', 'primary_type', 'description', 'location_description', 'beat', 'arrest', 'domestic', 'district', 'latitude', 'longitude']
-        df = df[columns_to_keep].copy()  # Create a copy of the DataFrame
+        df = df.reindex(columns=columns_to_keep)  # Pages may omit columns that are empty for every row
 
-        df.loc[:, 'arrest'] = df['arrest'].astype(int)
-        df.loc[:, 'domestic'] = df['domestic'].astype(int)
-        df.loc[:, 'district'] = df['district'].astype(int)
-        df[['date', 'time']] = df['date'].str.split('T', expand=True)
+        # Parse the ISO timestamps once here so consumers never re-parse date strings
+        timestamps = pd.to_datetime(df['date'], format='%Y-%m-%dT%H:%M:%S.%f', errors='coerce')
+        df = df[timestamps.notna()].copy()
+        df['timestamp'] = (timestamps[timestamps.notna()] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
 
-        district_to_area = {
-            2: 'Area Central', 3: 'Area Central', 7: 'Area Central', 8: 'Area Central', 9: 'Area Central',
-            4: 'Area South', 5: 'Area South', 6: 'Area South',
-            1: 'Area North', 10: 'Area North', 11: 'Area North', 12: 'Area North', 14: 'Area North', 15: 'Area North', 16: 'Area North', 17: 'Area North', 18: 'Area North', 19: 'Area North', 20: 'Area North', 22: 'Area North', 24: 'Area North', 25: 'Area North'
-        }
-        df['area'] = df['district'].map(district_to_area)
+        df['id'] = pd.to_numeric(df['id']).astype('int64')
+        df['arrest'] = df['arrest'].astype(str).str.lower().eq('true').astype('int8')
+        df['domestic'] = df['domestic'].astype(str).str.lower().eq('true').astype('int8')
+        df['district'] = pd.to_numeric(df['district'], errors='coerce').astype('Int16')
+        df['beat'] = pd.to_numeric(df['beat'], errors='coerce').astype('Int16')
+        df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
+        df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
+        df['utm_x'], df['utm_y'] = project_to_utm(df['longitude'], df['latitude'])
+        df = self.apply_beat_boundaries(df)
+
+        df['area'] = df['district'].map(DISTRICT_TO_AREA)
+        return df.drop(columns=['date'])
+    
+    # Fill in or correct beat and district from the beat polygon each incident falls in.
+    # The feed's values are kept for points outside every polygon, or when the shapefile is not available.
+    def apply_beat_boundaries(self, df):
+        if not self.beat_shapefile or not os.path.exists(self.beat_shapefile):
+            return df
+        beat, district = assign_beats(df['longitude'], df['latitude'], self.beat_shapefile)
+        found = beat >= 0
+        df['beat'] = df['beat'].mask(found, pd.array(beat, dtype='Int16'))
+        df['district'] = df['district'].mask(found & (district >= 0), pd.array(district, dtype='Int16'))
         return df
     
+    # Re-run the beat assignment over rows already in the database, a chunk at a time, and
+    # return how many rows had their beat or district changed
+    @profiled('ingest.revalidate_beats', rows_out=lambda changed: changed)
+    def revalidate_beats(self, chunksize=200000):
+        conn = sqlite3.connect(self.db_name)
+        create_schema(conn)
+        changed = 0
+        last_id = -1
+        while True:
+            chunk = pd.read_sql_query(
+                "SELECT id, beat, district, latitude, longitude FROM crimes WHERE id > ? ORDER BY id LIMIT ?",
+                conn, params=(last_id, chunksize)
+            )
+            if chunk.empty:
+                break
+            last_id = int(chunk['id'].iloc[-1])
+            fixed = self.apply_beat_boundaries(chunk.astype({'beat': 'Int16', 'district': 'Int16'}))
+            fixed['area'] = fixed['district'].map(DISTRICT_TO_AREA)
+            moved = fixed[(fixed['beat'].ne(chunk['beat']) | fixed['district'].ne(chunk['district'])).fillna(True)]
+            with conn:
+                before = conn.total_changes
+                frame = moved[['beat', 'district', 'area', 'id']].astype(object)
+                conn.executemany(
+                    "UPDATE crimes SET beat = ?, district = ?, area = ? WHERE id = ? AND (beat IS NOT ? OR district IS NOT ?)",
+                    [row + row[:2] for row in frame.where(frame.notna(), None).itertuples(index=False, name=None)]
+                )
+                updated = conn.total_changes - before
+                if updated:
+                    refresh_daily_counts(conn, stored_days(conn, moved['id']))
+                changed += updated
+        conn.close()
+        return changed
+    
+    # Write new and changed rows in batches inside a single transaction.
+    # Returns the number of inserted and updated rows; unchanged rows are left alone.
+    # daily_counts is recounted for every day the batch touches, including the previous day of
+    # rows whose timestamp changed, in the same transaction.
+    @profiled('ingest.upsert', rows_in=lambda self, conn, df, *args, **kwargs: len(df), rows_out=lambda counts: counts['inserted'] + counts['updated'])
+    def upsert_records(self, conn, df, batch_size=5000):
+        df = df.drop_duplicates(subset=['id'], keep='last')
+        counts = {'inserted': 0, 'updated': 0}
+        with conn:
+            for column, table in LOOKUP_TABLES.items():
+                df[f'{column}_id'] = df[column].map(encode_lookup(conn, table, df[column]))
+            frame = df[CRIME_COLUMNS].astype(object)
+            rows = list(frame.where(frame.notna(), None).itertuples(index=False, name=None))
+            days = {row[1] // 86400 for row in rows if row[1] is not None}
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                days.update(stored_days(conn, [row[0] for row in batch]))
+                ids = json.dumps([int(row[0]) for row in batch])
+                existing = conn.execute("SELECT COUNT(*) FROM crimes WHERE id IN (SELECT value FROM json_each(?))", (ids,)).fetchone()[0]
+                changes_before = conn.total_changes
+                conn.executemany(UPSERT_CRIMES, batch)
+                written = conn.total_changes - changes_before
+                counts['inserted'] += len(batch) - existing
+                counts['updated'] += written - (len(batch) - existing)
+            if counts['inserted'] or counts['updated']:
+                refresh_daily_counts(conn, days)
+        return counts
+    
     def save_to_database(self, df):
         conn = sqlite3.connect(self.db_name)
-        df.to_sql('crimes', conn, if_exists='replace', index=False)
+        drop_crimes(conn)
+        counts = self.upsert_records(conn, df)
         conn.close()
+        return counts
     
     def update_database(self, new_data):
         conn = sqlite3.connect(self.db_name)
-        existing_data = pd.read_sql_query("SELECT * FROM crimes", conn)
-        combined_data = pd.concat([existing_data, new_data]).drop_duplicates(subset=['id'])
-        combined_data.to_sql('crimes', conn, if_exists='replace', index=False)
+        create_schema(conn)
+        counts = self.upsert_records(conn, new_data)
         conn.close()
+        return counts
+    
+    def load_checkpoint(self, conn, dataset_identifier, start_date, end_date):
+        row = conn.execute(
+            "SELECT last_date, last_id FROM ingest_checkpoints WHERE dataset = ? AND start_date = ? AND end_date = ?",
+            (dataset_identifier, start_date, end_date)
+        ).fetchone()
+        return tuple(row) if row else None
+    
+    def save_checkpoint(self, conn, dataset_identifier, start_date, end_date, cursor):
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_checkpoints (dataset, start_date, end_date, last_date, last_id) VALUES (?, ?, ?, ?, ?)",
+                (dataset_identifier, start_date, end_date, cursor[0], cursor[1])
+            )
+    
+    def clear_checkpoint(self, conn, dataset_identifier, start_date, end_date):
+        with conn:
+            conn.execute(
+                "DELETE FROM ingest_checkpoints WHERE dataset = ? AND start_date = ? AND end_date = ?",
+                (dataset_identifier, start_date, end_date)
+            )
+    
+    # Fetch, clean and write the date range page by page so only one page is held in memory.
+    # The cursor is checkpointed after every page; an interrupted pull picks up from the last
+    # checkpoint, and since upserts are idempotent a page written before a crash is harmless.
+    # With replace=True the crimes table is rebuilt from scratch unless a pull of the same range was interrupted.
+    # progress(counts) is called with the running counts after each checkpoint; an exception
+    # raised from it stops the pull there, to be resumed by the next call.
+    def stream_ingest(self, dataset_identifier, start_date, end_date, page_size=100000, replace=False, progress=None):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            with stage('ingest.stream', rows_in=0, dataset=dataset_identifier) as current:
+                create_schema(conn)
+                cursor = self.load_checkpoint(conn, dataset_identifier, start_date, end_date)
+                if replace and cursor is None:
+                    drop_crimes(conn)
+                counts = {'inserted': 0, 'updated': 0}
+                pages = self.iter_record_pages(dataset_identifier, start_date, end_date, page_size, cursor=cursor, client=self.get_thread_client())
+                for results, cursor in pages:
+                    current.rows_in += len(results)
+                    cleaned_df = self.clean_data(pd.DataFrame(results))
+                    page_counts = self.upsert_records(conn, cleaned_df)
+                    counts['inserted'] += page_counts['inserted']
+                    counts['updated'] += page_counts['updated']
+                    current.rows_out = counts['inserted'] + counts['updated']
+                    self.save_checkpoint(conn, dataset_identifier, start_date, end_date, cursor)
+                    if progress is not None:
+                        progress(counts)
+                self.clear_checkpoint(conn, dataset_identifier, start_date, end_date)
+        finally:
+            conn.close()
+        return counts
+    
+    # Runs on a worker thread: fetch every page of one window with that thread's client
+    def fetch_window(self, dataset_identifier, window_start, window_end, page_size, rate_limiter):
+        return self.fetch_records_in_date_range(dataset_identifier, window_start, window_end, page_size,
+                                                client=self.get_thread_client(), rate_limiter=rate_limiter)
+    
+    # Fetch the date range as sub-windows on a bounded thread pool and upsert each window as it
+    # arrives. Only the main thread touches the database, and upserting by id keeps the merge
+    # free of duplicates. At most 2 * max_workers windows are held in memory at once.
+    @profiled('ingest.parallel', rows_out=lambda counts: counts['inserted'] + counts['updated'])
+    def parallel_ingest(self, dataset_identifier, start_date, end_date, freq='MS', max_workers=4, requests_per_second=None, page_size=50000):
+        windows = split_date_range(start_date, end_date, freq)
+        rate_limiter = RateLimiter(requests_per_second)
+        conn = sqlite3.connect(self.db_name)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            create_schema(conn)
+            counts = {'inserted': 0, 'updated': 0}
+            pending = set()
+            while windows or pending:
+                while windows and len(pending) < 2 * max_workers:
+                    window_start, window_end = windows.pop(0)
+                    pending.add(executor.submit(self.fetch_window, dataset_identifier, window_start, window_end, page_size, rate_limiter))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    records = future.result()
+                    if not records:
+                        continue
+                    window_counts = self.upsert_records(conn, self.clean_data(pd.DataFrame(records)))
+                    counts['inserted'] += window_counts['inserted']
+                    counts['updated'] += window_counts['updated']
+        finally:
+            # On an error the windows not yet started are dropped instead of fetched
+            executor.shutdown(cancel_futures=True)
+            conn.close()
+        return counts
+    
+    def fetch_initial_data(self, dataset_identifier, start_date, end_date, progress=None):
+        return self.stream_ingest(dataset_identifier, start_date, end_date, replace=True, progress=progress)
     
-    def fetch_initial_data(self, dataset_identifier, start_date, end_date):
-        records = self.fetch_records_in_date_range(dataset_identifier, start_date, end_date)
-        df = pd.DataFrame(records)
-        cleaned_df = self.clean_data(df)
-        self.save_to_database(cleaned_df)
-    
-    def add_new_data(self, dataset_identifier, start_date, end_date):
-        records = self.fetch_records_in_date_range(dataset_identifier, start_date, end_date)
-        df = pd.DataFrame(records)
-        cleaned_df = self.clean_data(df)
-        self.update_database(cleaned_df)
+    def add_new_data(self, dataset_identifier, start_date, end_date, progress=None):
+        return self.stream_ingest(dataset_identifier, start_date, end_date, progress=progress)
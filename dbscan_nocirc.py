@@ -1,70 +1,45 @@
 import pandas as pd
 import numpy as np
-import sqlite3
-from sklearn.cluster import DBSCAN
+from crime_db import load_crimes
 import folium
-from folium.plugins import MarkerCluster
+from folium.plugins import FastMarkerCluster
 import seaborn as sns
-import geopandas as gpd
-import pyproj
 import webbrowser
+from clustering_analysis import cluster_districts, convert_to_utm
+from beat_boundaries import add_beat_layer
 
 # Function to load data from the database
-def load_data(db_path):
-    conn = sqlite3.connect(db_path)
-    query = "SELECT * FROM crimes"
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    data['datetime'] = pd.to_datetime(data['date'] + ' ' + data['time'])
-    return data
-
-# Function to convert latitude and longitude to UTM coordinates
-def convert_to_utm(data):
-    data['latitude'] = pd.to_numeric(data['latitude'], errors='coerce')
-    data['longitude'] = pd.to_numeric(data['longitude'], errors='coerce')
-    data = data.dropna(subset=['latitude', 'longitude'])
-    
-    proj_utm = pyproj.Proj(proj='utm', zone=16, ellps='WGS84', south=False)
-    data['utm_x'], data['utm_y'] = proj_utm(data['longitude'].values, data['latitude'].values)
-    return data
+def load_data(db_path, start=None, end=None):
+    return load_crimes(db_path, ['id', 'datetime', 'district', 'latitude', 'longitude', 'utm_x', 'utm_y'], start=start, end=end)
 
 # Function to apply DBSCAN clustering
-def apply_dbscan(data, eps, min_samples):
-    cluster_results = pd.DataFrame()
-    for district in data['district'].unique():
-        subset = data[data['district'] == district]
-        coordinates = subset[['utm_x', 'utm_y']].values
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-        subset['cluster'] = dbscan.fit_predict(coordinates)
-        cluster_results = pd.concat([cluster_results, subset])
-    return cluster_results
+def apply_dbscan(data, eps, min_samples, n_jobs=None):
+    data = data[data['district'].notna()].reset_index(drop=True)
+    return data.assign(cluster=cluster_districts(data, eps, min_samples, n_jobs))
+
+# Builds each constant-size circle in the browser from [latitude, longitude, color] rows
+CONSTANT_SIZE_MARKER = """
+function (row) {
+    var html = '<div style="background-color:' + row[2] + ';width:20px;height:20px;border-radius:50%;' +
+        'opacity:0.4;border:3px solid ' + row[2] + ';"></div>';
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: L.divIcon({html: html, className: 'empty'})});
+}
+"""
 
-# Updated function to create map with constant size clusters
+# Updated function to create map with constant size clusters.
+# The clustered incidents go to the page as one array and their markers are made client-side,
+# instead of one folium object per incident.
 def create_map_with_cluster_size(data, cluster_results, beat_boundaries):
     map = folium.Map(location=[data['latitude'].mean(), data['longitude'].mean()], zoom_start=11)
-    district_colors = sns.color_palette('hsv', len(data['district'].unique())).as_hex()
-    
-    # Calculate cluster sizes
-    cluster_sizes = cluster_results['cluster'].value_counts().to_dict()
-    
-    marker_cluster = MarkerCluster().add_to(map)
+    districts = data['district'].dropna().unique()
+    district_colors = dict(zip((int(d) for d in districts), sns.color_palette('hsv', len(districts)).as_hex()))
     
-    for idx, row in cluster_results.iterrows():
-        if row['cluster'] != -1:
-            district_index = list(data['district'].unique()).index(row['district'])
-            cluster_color = district_colors[district_index]
-            cluster_size = cluster_sizes[row['cluster']]
-            folium.Marker(
-                location=[row['latitude'], row['longitude']],
-                icon=folium.DivIcon(html=f"""
-                    <div style="background-color:{cluster_color};width:20px;height:20px;border-radius:50%;
-                    opacity:0.4;border:3px solid {cluster_color};">
-                    </div>"""
-                )
-            ).add_to(marker_cluster)
+    clustered = cluster_results[cluster_results['cluster'] != -1]
+    colors = clustered['district'].astype(int).map(district_colors)
+    rows = list(zip(clustered['latitude'].tolist(), clustered['longitude'].tolist(), colors.tolist()))
+    FastMarkerCluster(rows, callback=CONSTANT_SIZE_MARKER).add_to(map)
     
-    for idx, row in beat_boundaries.iterrows():
-        folium.GeoJson(row['geometry']).add_to(map)
+    add_beat_layer(map, beat_boundaries)
     
     map.save('Chicago_crime_clusters_with_constant_size.html')
     webbrowser.open('Chicago_crime_clusters_with_constant_size.html')
@@ -1,97 +1,214 @@
+import numpy as np
 import pandas as pd
-import sqlite3
+from crime_db import load_crimes, lookup_codes, to_epoch
+from profiling import profiled, stage
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.inspection import permutation_importance
 from sklearn.metrics import classification_report, accuracy_score, roc_curve, auc
 from imblearn.over_sampling import SMOTE
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import io
 from PIL import Image
 
-def load_data(db_path):
-    conn = sqlite3.connect(db_path)
-    query = "SELECT * FROM crimes"
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    return data
+def load_data(db_path, columns, start=None, end=None):
+    return load_crimes(db_path, columns, start=start, end=end)
 
-def run_decision_tree_analysis(db_path, selected_vars):
-    data = load_data(db_path)
-    
-    # Ensure date column is in datetime format
-    data['date'] = pd.to_datetime(data['date'], errors='coerce')
-    
-    # Filter data by date range if required
-    data = data[(data["date"] >= '2023-01-01') & (data["date"] <= '2023-12-31')]
-    
-    # Drop rows with missing target values
-    data = data.dropna(subset=['arrest', 'latitude', 'longitude'])
-    
-    # Combine latitude and longitude into a single column if included
-    if 'latitude' in selected_vars and 'longitude' in selected_vars:
-        data['coordinates'] = data.apply(lambda row: f"{row['latitude']},{row['longitude']}", axis=1)
-        selected_vars.append('coordinates')
-        selected_vars.remove('latitude')
-        selected_vars.remove('longitude')
-    
-    # Encoding categorical features
-    label_encoders = {}
+# Stored column read for each selectable variable; lookup-coded variables are used by their code
+FEATURE_COLUMNS = {
+    'primary_type': 'primary_type_id',
+    'location_description': 'location_description_id',
+}
+
+# South-west corner of the spatial grid in UTM zone 16N metres, below and left of the city, and
+# its size in metres east and north; Chicago lies well inside it
+GRID_ORIGIN = (400000, 4600000)
+GRID_EXTENT = (80000, 80000)
+
+# Cell ids are stored in the float32 feature matrix, which holds integers exactly up to 2**24
+MAX_GRID_CELLS = 2 ** 24
+
+# Columns and rows of grid_size-metre cells covering the grid
+def grid_shape(grid_size):
+    shape = tuple(int(np.ceil(extent / grid_size)) for extent in GRID_EXTENT)
+    if shape[0] * shape[1] > MAX_GRID_CELLS:
+        smallest = np.ceil(np.sqrt(GRID_EXTENT[0] * GRID_EXTENT[1] / MAX_GRID_CELLS))
+        raise ValueError(f"grid_size {grid_size} m gives {shape[0] * shape[1]:,} cells, more than float32 features hold exactly; use at least {smallest:.0f} m")
+    return shape
+
+# Features derived from the incident time for every model
+TIME_FEATURES = ['hour', 'weekday', 'month']
+
+# Rows with a known arrest flag and location, with the stored columns the features are built from.
+# They are taken from crimes instead of the database when incidents with those columns are
+# already loaded.
+@profiled('arrest.load', rows_out=len)
+def load_feature_data(db_path, selected_vars, start=None, end=None, grid_size=None, crimes=None):
+    columns = [FEATURE_COLUMNS.get(column, column) for column in selected_vars] + ['timestamp', 'arrest', 'latitude', 'longitude']
+    if grid_size:
+        columns += ['utm_x', 'utm_y']
+    columns = list(dict.fromkeys(columns))
+    if crimes is None:
+        data = load_data(db_path, columns, start=start, end=end)
+    else:
+        in_window = pd.Series(True, index=crimes.index)
+        if start is not None:
+            in_window &= crimes['timestamp'] >= to_epoch(start)
+        if end is not None:
+            in_window &= crimes['timestamp'] < to_epoch(end)
+        data = crimes.loc[in_window, columns]
+    return data.dropna(subset=['arrest', 'latitude', 'longitude']).reset_index(drop=True)
+
+# float32 feature matrix for the selected variables plus hour, weekday and month, built with
+# column operations only. Lookup-coded variables keep their schema codes, description uses its
+# position in description_categories (learned from the data when not given), beat and district
+# stay integers and latitude/longitude stay numeric; with grid_size they are replaced by the id of
+# the grid_size-metre UTM cell (-1 outside the grid). Missing values are -1.
+# Returns the matrix, the feature names and the description categories used.
+@profiled('arrest.features', rows_in=lambda data, *args, **kwargs: len(data), rows_out=lambda result: len(result[0]))
+def build_features(data, selected_vars, description_categories=None, grid_size=None):
+    features = {}
     for column in selected_vars:
-        label_encoders[column] = LabelEncoder()
-        data[column] = label_encoders[column].fit_transform(data[column])
-    
-    # Define features and target
-    X = data[selected_vars]
-    y = data['arrest'].astype(int)
+        if column in ('latitude', 'longitude') and grid_size:
+            continue
+        if column == 'description':
+            if description_categories is None:
+                description_categories = list(data['description'].astype('category').cat.categories)
+            features[column] = pd.Categorical(data['description'], categories=description_categories).codes
+        else:
+            features[column] = data[FEATURE_COLUMNS.get(column, column)].to_numpy(dtype='float32', na_value=-1)
+    if grid_size and ('latitude' in selected_vars or 'longitude' in selected_vars):
+        shape = grid_shape(grid_size)
+        cells = np.floor((data[['utm_x', 'utm_y']].to_numpy(dtype='float64', na_value=np.nan) - GRID_ORIGIN) / grid_size)
+        inside = ((cells >= 0) & (cells < shape)).all(axis=1)
+        grid_cell = np.full(len(data), -1, dtype='int64')
+        grid_cell[inside] = np.ravel_multi_index(cells[inside].astype('int64').T, shape)
+        features['grid_cell'] = grid_cell
+
+    # Chicago wall-clock seconds: day 0 (1970-01-01) was a Thursday
+    timestamp = data['timestamp'].to_numpy()
+    features['hour'] = timestamp % 86400 // 3600
+    features['weekday'] = (timestamp // 86400 + 3) % 7
+    features['month'] = pd.to_datetime(timestamp, unit='s').month
+
+    feature_names = list(features)
+    X = np.empty((len(data), len(feature_names)), dtype='float32')
+    for i, name in enumerate(feature_names):
+        X[:, i] = features[name]
+    return X, feature_names, description_categories
+
+# Ways to train the arrest model.
+# smote: the original setup, a fully grown Random Forest on SMOTE-oversampled training data.
+# balanced: a Random Forest weighting classes per bootstrap sample instead of oversampling, so the
+#   training set is not inflated; max_samples and max_depth cap the size of each tree.
+# hist_gb: histogram gradient boosting with balanced class weights, which bins the features once
+#   and scales to millions of rows.
+TRAINING_MODES = ['smote', 'balanced', 'hist_gb']
+
+@profiled('arrest.train', rows_in=lambda X_train, *args, **kwargs: len(X_train))
+def train_model(X_train, y_train, mode='smote', n_jobs=-1, n_estimators=100, max_samples=None, max_depth=None, random_state=42):
+    if mode == 'smote':
+        X_train, y_train = SMOTE(random_state=random_state).fit_resample(X_train, y_train)
+        model = RandomForestClassifier(n_estimators=n_estimators, max_samples=max_samples, max_depth=max_depth, n_jobs=n_jobs, random_state=random_state)
+    elif mode == 'balanced':
+        model = RandomForestClassifier(
+            n_estimators=n_estimators, class_weight='balanced_subsample', max_samples=max_samples,
+            max_depth=max_depth, n_jobs=n_jobs, random_state=random_state
+        )
+    elif mode == 'hist_gb':
+        model = HistGradientBoostingClassifier(class_weight='balanced', max_depth=max_depth, random_state=random_state)
+    else:
+        raise ValueError(f"Unknown training mode: {mode}")
+    return model.fit(X_train, y_train)
+
+# Impurity importances for forests; models without them get permutation importances on up to
+# max_rows test rows
+@profiled('arrest.importances', rows_in=lambda model, X_test, *args, **kwargs: len(X_test))
+def feature_importances(model, X_test, y_test, max_rows=20000, random_state=42):
+    if hasattr(model, 'feature_importances_'):
+        return model.feature_importances_
+    rows = np.random.default_rng(random_state).permutation(len(X_test))[:max_rows]
+    return permutation_importance(model, X_test[rows], y_test[rows], scoring='roc_auc', n_repeats=3, random_state=random_state).importances_mean
+
+# With a model registry (see model_registry.py) a model trained on the same inputs, setup and data
+# is loaded instead of retrained, and a newly trained model is saved to it
+@profiled('arrest.run')
+def run_decision_tree_analysis(db_path, selected_vars, start='2023-01-01', end='2024-01-01', mode='smote', grid_size=None, registry=None, crimes=None, **train_options):
+    # Only the selected features and the target are read, for the training window (2023 by default)
+    data = load_feature_data(db_path, selected_vars, start, end, grid_size, crimes)
+
+    # Rows taken from crimes may cover less than the window, so they are fingerprinted themselves
+    key = registry.model_key(db_path, selected_vars, start, end, mode, train_options, grid_size, data if crimes is not None else None) if registry else None
+    cached = registry.load(key) if registry else None
+    X, feature_names, description_categories = build_features(data, selected_vars, cached[1]['description_categories'] if cached else None, grid_size)
+    y = data['arrest'].to_numpy(dtype='int8')
     
     # Split data into training and testing sets
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
     
-    # Address class imbalance using SMOTE
-    smote = SMOTE(random_state=42)
-    X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
-    
-    # Train Random Forest Classifier
-    clf = RandomForestClassifier()
-    clf.fit(X_train_resampled, y_train_resampled)
+    # Train the classifier, handling class imbalance as the mode specifies
+    if cached:
+        clf = cached[0]
+    else:
+        clf = train_model(X_train, y_train, mode, **train_options)
     
     # Predictions and performance metrics
-    y_pred = clf.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
-    class_report = classification_report(y_test, y_pred)
-    fpr, tpr, _ = roc_curve(y_test, clf.predict_proba(X_test)[:,1])
-    roc_auc = auc(fpr, tpr)
+    with stage('arrest.evaluate', rows_in=len(X_test)):
+        y_pred = clf.predict(X_test)
+        accuracy = accuracy_score(y_test, y_pred)
+        class_report = classification_report(y_test, y_pred)
+        fpr, tpr, _ = roc_curve(y_test, clf.predict_proba(X_test)[:,1])
+        roc_auc = auc(fpr, tpr)
+    importances = cached[1]['feature_importances'] if cached else list(map(float, feature_importances(clf, X_test, y_test)))
+
+    if registry and not cached:
+        registry.save(key, clf, {
+            'selected_vars': list(selected_vars),
+            'feature_names': feature_names,
+            'description_categories': description_categories,
+            'grid_size': grid_size,
+            'lookups': lookup_codes(db_path),
+            'start': start,
+            'end': end,
+            'mode': mode,
+            'train_options': train_options,
+            'training_rows': len(X_train),
+            'accuracy': accuracy,
+            'auc': roc_auc,
+            'feature_importances': importances,
+        })
     
     # Plot feature importances
-    feature_importances = clf.feature_importances_
-    feature_importance_df = pd.DataFrame({'feature': X.columns, 'importance': feature_importances})
+    feature_importance_df = pd.DataFrame({'feature': feature_names, 'importance': importances})
     feature_importance_df = feature_importance_df.sort_values('importance', ascending=False)
     
-    plt.figure(figsize=(10, 6))
-    sns.barplot(x='importance', y='feature', data=feature_importance_df)
-    plt.title('Feature Importances')
-    plt.tight_layout()
+    # Figures are built without pyplot so the analysis can run off the GUI thread
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    sns.barplot(x='importance', y='feature', data=feature_importance_df, ax=ax)
+    ax.set_title('Feature Importances')
+    fig.tight_layout()
     
     buf_feature_importance = io.BytesIO()
-    plt.savefig(buf_feature_importance, format='png')
+    fig.savefig(buf_feature_importance, format='png')
     buf_feature_importance.seek(0)
     
     # Plot ROC curve
-    plt.figure(figsize=(10, 6))
-    plt.plot(fpr, tpr, label=f'ROC curve (area = {roc_auc:0.2f})')
-    plt.plot([0, 1], [0, 1], 'k--')
-    plt.xlim([0.0, 1.0])
-    plt.ylim([0.0, 1.05])
-    plt.xlabel('False Positive Rate')
-    plt.ylabel('True Positive Rate')
-    plt.title('Receiver Operating Characteristic')
-    plt.legend(loc='lower right')
-    plt.tight_layout()
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(fpr, tpr, label=f'ROC curve (area = {roc_auc:0.2f})')
+    ax.plot([0, 1], [0, 1], 'k--')
+    ax.set_xlim([0.0, 1.0])
+    ax.set_ylim([0.0, 1.05])
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title('Receiver Operating Characteristic')
+    ax.legend(loc='lower right')
+    fig.tight_layout()
     
     buf_decision_tree = io.BytesIO()
-    plt.savefig(buf_decision_tree, format='png')
+    fig.savefig(buf_decision_tree, format='png')
     buf_decision_tree.seek(0)
     
     stats = (
@@ -0,0 +1,136 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import holidays
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, mean_squared_error
+from crime_db import load_daily_counts
+from anomalies import count_matrix
+from time_series_analysis import MODEL_CACHE_DIR, forecast_area
+
+# Forecasting backends for many daily count series at once.
+# Every backend has the same two methods: fit(keys, dates, matrix) with the (series x day) count
+# matrix from count_matrix, and predict(future_dates) returning a (series x future day) array.
+
+# Illinois holidays in the given years as a Prophet-style (ds, holiday) table
+def holiday_table(years):
+    days = holidays.US(state='IL', years=list(years))
+    table = pd.DataFrame(sorted(days.items()), columns=['ds', 'holiday'])
+    table['ds'] = pd.to_datetime(table['ds'])
+    return table
+
+# Readable name of each series, e.g. 'district=7|primary_type=THEFT'
+def series_names(keys):
+    return ['|'.join(f'{col}={value}' for col, value in zip(keys.columns, row)) for row in keys.itertuples(index=False, name=None)]
+
+# Average of the last few weeks for each weekday, repeated forward
+class SeasonalNaiveBackend:
+    name = 'seasonal_naive'
+
+    def __init__(self, weeks=4):
+        self.weeks = weeks
+
+    def fit(self, keys, dates, matrix):
+        weeks = max(1, min(self.weeks, matrix.shape[1] // 7))
+        recent = matrix[:, -7 * weeks:].reshape(len(matrix), weeks, 7).mean(axis=1)
+        # Reorder the columns so column k is weekday k
+        self.profile = recent[:, np.argsort(dates[-7:].dayofweek)]
+        return self
+
+    def predict(self, future_dates):
+        return self.profile[:, future_dates.dayofweek]
+
+# Ridge regression on a linear trend, weekday effects, yearly Fourier terms and a holiday flag.
+# The design matrix is shared by all series, so fitting every series is one linear solve.
+class FourierRidgeBackend:
+    name = 'fourier_ridge'
+
+    def __init__(self, yearly_order=8, alpha=1.0, holiday_dates=None):
+        self.yearly_order = yearly_order
+        self.alpha = alpha
+        self.holiday_dates = holiday_dates
+
+    def design(self, dates):
+        years = (dates - self.origin).days.to_numpy() / 365.25
+        columns = [np.ones(len(dates)), years]
+        columns += [(dates.dayofweek == day).astype('float64') for day in range(1, 7)]
+        for order in range(1, self.order + 1):
+            columns += [np.sin(2 * np.pi * order * years), np.cos(2 * np.pi * order * years)]
+        holiday_dates = self.holiday_dates if self.holiday_dates is not None else holiday_table(range(dates.year.min(), dates.year.max() + 1))
+        columns.append(dates.isin(holiday_dates['ds']).astype('float64'))
+        return np.column_stack(columns)
+
+    def fit(self, keys, dates, matrix):
+        self.origin = dates[0]
+        # Yearly terms fitted on less than a year of data extrapolate wildly
+        self.order = self.yearly_order if (dates[-1] - dates[0]).days >= 365 else 0
+        features = self.design(dates)
+        # No penalty on the intercept
+        penalty = self.alpha * np.eye(features.shape[1])
+        penalty[0, 0] = 0
+        self.coef = np.linalg.solve(features.T @ features + penalty, features.T @ matrix.T.astype('float64'))
+        return self
+
+    def predict(self, future_dates):
+        return np.maximum(self.design(future_dates) @ self.coef, 0).T
+
+# One Prophet model per series through time_series_analysis.forecast_area, so fits share its
+# process pool pattern and model cache. Prophet fits and predicts in one step, so the work
+# happens in predict.
+class ProphetBackend:
+    name = 'prophet'
+
+    def __init__(self, holiday_dates=None, n_jobs=None, cache_dir=MODEL_CACHE_DIR):
+        self.holiday_dates = holiday_dates
+        self.n_jobs = n_jobs
+        self.cache_dir = cache_dir
+
+    def fit(self, keys, dates, matrix):
+        self.names = series_names(keys)
+        self.dates = dates
+        self.matrix = matrix
+        return self
+
+    def predict(self, future_dates):
+        holiday_dates = self.holiday_dates if self.holiday_dates is not None else holiday_table(range(self.dates.year.min(), future_dates.year.max() + 1))
+        train_start, train_end = str(self.dates[0].date()), str(self.dates[-1].date())
+        tasks = [
+            (name, pd.DataFrame({'ds': self.dates, 'y': series}), holiday_dates, train_start, train_end, future_dates, self.cache_dir)
+            for name, series in zip(self.names, self.matrix)
+        ]
+        n_jobs = min(self.n_jobs or os.cpu_count() or 1, len(tasks)) or 1
+        if n_jobs == 1:
+            forecasts = [forecast_area(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                forecasts = list(executor.map(forecast_area, *zip(*tasks)))
+        return np.array([np.maximum(forecast['yhat'].to_numpy(), 0) for forecast in forecasts]).reshape(len(tasks), len(future_dates))
+
+BACKENDS = {backend.name: backend for backend in [SeasonalNaiveBackend, FourierRidgeBackend, ProphetBackend]}
+
+# Fit a backend on the daily counts of each group in the training window and forecast the future
+# dates. Returns one row per group and future date with the forecast in yhat.
+def forecast_series(db_path, by, train_start, train_end, future_dates, backend=None):
+    backend = backend or FourierRidgeBackend()
+    keys, dates, matrix = count_matrix(load_daily_counts(db_path, start=train_start, end=train_end, by=by), by)
+    predicted = backend.fit(keys, dates, matrix).predict(future_dates)
+    forecast = keys.loc[keys.index.repeat(len(future_dates))].reset_index(drop=True)
+    forecast['date'] = np.tile(future_dates, len(keys))
+    forecast['yhat'] = predicted.reshape(-1)
+    return forecast
+
+# Fit on all but the last holdout_days of the matrix and score the forecast of those days.
+# Errors are over every (series, day) cell; seconds covers fit and predict.
+def evaluate(backend, keys, dates, matrix, holdout_days=90):
+    train, actual = matrix[:, :-holdout_days], matrix[:, -holdout_days:]
+    start = time.perf_counter()
+    predicted = backend.fit(keys, dates[:-holdout_days], train).predict(dates[-holdout_days:])
+    seconds = time.perf_counter() - start
+    return {
+        'backend': backend.name,
+        'series': len(matrix),
+        'mae': mean_absolute_error(actual.reshape(-1), predicted.reshape(-1)),
+        'rmse': np.sqrt(mean_squared_error(actual.reshape(-1), predicted.reshape(-1))),
+        'seconds': seconds,
+    }
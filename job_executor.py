@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import profiling
+
+# Runs analyses and ingests on worker threads so the Tk window stays responsive.
+# Workers never touch Tk: what they report goes through a queue that the main thread drains
+# every poll_ms milliseconds, and completion callbacks run on the main thread from there.
+# Every job is a profiling stage; the stages recorded on its thread are logged when it ends.
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, executor, name, key=None):
+        self.executor = executor
+        self.name = name
+        self.key = key
+        self.cancel_event = threading.Event()
+        self.started = time.perf_counter()
+        self.future = None
+        self.records = []
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    # Called by the work between steps. Cancellation is cooperative: a step that is already
+    # running (a Prophet fit, a page download) finishes before the job stops.
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.name)
+
+    # Console line from the worker thread
+    def log(self, message):
+        self.executor.post(self.executor.log, f"[{self.name}] {message}")
+
+    # Time one step of the job as a profiling stage and log how long it took
+    @contextmanager
+    def stage(self, name):
+        self.check_cancelled()
+        self.log(f"{name}...")
+        with profiling.stage(name) as measured:
+            yield measured
+        self.log(f"{name} done in {measured.record['seconds']:.1f}s")
+
+class JobExecutor:
+    # log(message) writes to the console and status(names) shows the running jobs; both are
+    # only ever called on the main thread
+    def __init__(self, root, log=print, status=None, max_workers=4, poll_ms=100):
+        self.root = root
+        self.log = log
+        self.status = status
+        self.poll_ms = poll_ms
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.messages = queue.Queue()
+        self.jobs = []
+        root.after(poll_ms, self.poll)
+
+    # Queue a call to run on the main thread
+    def post(self, function, *args):
+        self.messages.put((function, args))
+
+    # Run work(job) on a worker thread, then on_done(result) or on_error(exception) on the main
+    # thread. A job with the same key as a running one is refused, e.g. a second ingest.
+    def submit(self, name, work, on_done=None, on_error=None, key=None):
+        if key is not None and any(job.key == key for job in self.jobs):
+            self.log(f"[{name}] not started: another {key} job is running")
+            return None
+        job = Job(self, name, key)
+        self.jobs.append(job)
+        self.log(f"[{name}] started")
+        self.show_status()
+        job.future = self.pool.submit(self.run, job, work, on_done, on_error)
+        return job
+
+    # Runs on a worker thread
+    def run(self, job, work, on_done, on_error):
+        thread = threading.current_thread()
+
+        def collect(record):
+            if threading.current_thread() is thread:
+                job.records.append(record)
+
+        profiling.add_listener(collect)
+        try:
+            with profiling.stage(job.name):
+                job.check_cancelled()
+                result = work(job)
+                job.check_cancelled()
+        except JobCancelled:
+            self.post(self.finish, job, 'cancelled', None, None)
+        except Exception as e:
+            self.post(self.finish, job, 'failed', e, on_error)
+        else:
+            self.post(self.finish, job, 'finished', result, on_done)
+        finally:
+            profiling.remove_listener(collect)
+
+    def finish(self, job, outcome, value, callback):
+        self.jobs.remove(job)
+        self.show_status()
+        self.log(f"[{job.name}] {outcome} after {time.perf_counter() - job.started:.1f}s")
+        if outcome == 'failed' and callback is None:
+            self.log(f"[{job.name}] {value}")
+        self.log_profile(job)
+        if callback is not None:
+            callback(value)
+
+    # The job's stages in the order they started, nested steps indented under their parent
+    def log_profile(self, job):
+        for record in sorted(job.records, key=lambda record: (record['started_at'], record['depth'])):
+            self.log(f"[{job.name}] {profiling.format_record(record)}")
+
+    # Drain the queue on the main thread and schedule the next poll
+    def poll(self):
+        while True:
+            try:
+                function, args = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                function(*args)
+            except Exception as e:
+                self.log(f"Error: {e}")
+        self.root.after(self.poll_ms, self.poll)
+
+    def show_status(self):
+        if self.status is not None:
+            self.status([job.name for job in self.jobs])
+
+    def cancel(self, name):
+        for job in self.jobs:
+            if job.name == name:
+                job.cancel()
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+        if self.jobs:
+            self.log(f"Cancelling {len(self.jobs)} job(s)...")
+
+    # Cancel everything and stop taking work; jobs already running stop at their next step
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.shutdown(wait=False, cancel_futures=True)
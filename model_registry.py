@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from crime_db import CRIME_COLUMNS, connect_reader, to_epoch
+from decision_tree_analysis import FEATURE_COLUMNS, GRID_EXTENT, GRID_ORIGIN, build_features
+
+# Trained arrest models, one directory per version holding model.joblib and meta.json
+MODEL_DIR = 'models'
+
+# Hash of every stored column of the incidents in a training window, read over the timestamp
+# index chunksize rows at a time. Any insert, delete or change to a row in the window changes it,
+# including edits that leave counts and sums alone such as two rows swapping a value. It reads
+# the whole window, which is still far cheaper than training on it.
+def data_fingerprint(db_path, start=None, end=None, chunksize=100000):
+    conn = connect_reader(db_path)
+    cursor = conn.execute(
+        f"SELECT {', '.join(CRIME_COLUMNS)} FROM crimes WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, id",
+        (to_epoch(start) if start is not None else -2 ** 62, to_epoch(end) if end is not None else 2 ** 62)
+    )
+    digest = hashlib.sha256()
+    rows = cursor.fetchmany(chunksize)
+    while rows:
+        digest.update(json.dumps(rows).encode())
+        rows = cursor.fetchmany(chunksize)
+    conn.close()
+    return digest.hexdigest()[:16]
+
+# Fingerprint of training rows already in memory, e.g. from incidents loaded for a narrower
+# window than the model's, which the database window's fingerprint would not describe
+def frame_fingerprint(data):
+    return hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+class ModelRegistry:
+    def __init__(self, root=MODEL_DIR):
+        self.root = root
+
+    # Version id of a model: its inputs, training setup, training window and the data in it.
+    # data: the training rows when they do not come straight from the database window
+    def model_key(self, db_path, selected_vars, start, end, mode, train_options=None, grid_size=None, data=None):
+        spec = {
+            'selected_vars': list(selected_vars),
+            'start': start,
+            'end': end,
+            'mode': mode,
+            'train_options': train_options or {},
+            'grid_size': grid_size,
+            'data': data_fingerprint(db_path, start, end) if data is None else frame_fingerprint(data),
+        }
+        # Grid cell ids depend on the grid's layout as well as its cell size
+        if grid_size:
+            spec['grid'] = [GRID_ORIGIN, GRID_EXTENT]
+        return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def load(self, key):
+        path = os.path.join(self.root, key)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return joblib.load(os.path.join(path, 'model.joblib')), meta
+
+    # meta holds what scoring needs (selected_vars, feature_names, description_categories,
+    # grid_size, lookups) plus the training setup and metrics
+    def save(self, key, model, meta):
+        path = os.path.join(self.root, key)
+        os.makedirs(path, exist_ok=True)
+        joblib.dump(model, os.path.join(path, 'model.joblib'))
+        meta = dict(meta, key=key, created_at=datetime.now().isoformat(timespec='seconds'))
+        # meta.json is written last, so a version without it is incomplete and ignored
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2, default=str)
+        return meta
+
+    # Metadata of every saved version, newest first
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        metas = []
+        for key in os.listdir(self.root):
+            meta_path = os.path.join(self.root, key, 'meta.json')
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    metas.append(json.load(f))
+        return sorted(metas, key=lambda meta: meta['created_at'], reverse=True)
+
+    def latest(self):
+        versions = self.versions()
+        return self.load(versions[0]['key']) if versions else None
+
+# Arrest probability of each incident, scored chunksize rows at a time so features for millions
+# of rows are never built at once. incidents needs timestamp and the stored columns of the
+# model's selected variables (as load_feature_data returns them); lookup-coded columns given by
+# name (as clean_data returns them) are mapped to codes with the model's lookups.
+def score(model, meta, incidents, chunksize=200000):
+    probabilities = np.empty(len(incidents), dtype='float32')
+    for start in range(0, len(incidents), chunksize):
+        chunk = incidents.iloc[start:start + chunksize]
+        for column, stored in FEATURE_COLUMNS.items():
+            if column in meta['selected_vars'] and stored not in chunk:
+                chunk = chunk.assign(**{stored: chunk[column].map(meta['lookups'][column]).astype('float64')})
+        X, _, _ = build_features(chunk, meta['selected_vars'], meta['description_categories'], meta['grid_size'])
+        probabilities[start:start + len(chunk)] = model.predict_proba(X)[:, 1]
+    return pd.Series(probabilities, index=incidents.index, name='arrest_probability')
@@ -0,0 +1,281 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Unix only; on Windows the figures come from psutil
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stage instrumentation. A stage records wall and CPU seconds, peak RSS, rows in and out and
+# rows per second; each finished stage is handed to the listeners (the GUI console, the batch
+# runner) and, when a log is configured, appended to it as one JSON line. Stages nest per thread.
+# CPU seconds and RSS are for the whole process plus its worker processes, so stages running
+# side by side on different threads see each other's usage.
+#
+# The log is opt-in: set CRIMESIGHT_PROFILE_LOG=profile.jsonl or call configure(log_path=...).
+# So are hot-path dumps of each outermost stage: profile='cprofile' writes a .prof file (pstats,
+# snakeviz) and the top functions as text; profile='py-spy' records a speedscope file with
+# py-spy when it is installed.
+
+settings = {
+    'log_path': os.environ.get('CRIMESIGHT_PROFILE_LOG') or None,
+    'profile': os.environ.get('CRIMESIGHT_PROFILE') or None,
+    'profile_dir': os.environ.get('CRIMESIGHT_PROFILE_DIR', 'profiles'),
+}
+
+# log_path=None turns the log off; profile is None, 'cprofile' or 'py-spy'
+def configure(**options):
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"unknown profiling settings: {', '.join(sorted(unknown))}")
+    if options.get('profile') not in (None, 'cprofile', 'py-spy'):
+        raise ValueError(f"unknown profiler: {options['profile']}")
+    settings.update(options)
+
+_listeners = []
+_log_lock = threading.Lock()
+_local = threading.local()
+
+def add_listener(listener):
+    _listeners.append(listener)
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+# Resident memory of this process and its worker processes, in bytes. Without psutil this is
+# the process high-water mark, which never goes down, or 0 where that is not available either.
+def rss():
+    if psutil is None:
+        if resource is None:
+            return 0
+        # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    process = psutil.Process()
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+# CPU seconds of this process and of its finished worker processes (without resource, psutil
+# counts the workers only where the platform reports them)
+def cpu_seconds():
+    if resource is not None:
+        own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    if psutil is not None:
+        times = psutil.Process().cpu_times()
+        return times.user + times.system + times.children_user + times.children_system
+    return time.process_time()
+
+# One sampler thread tracks the peak RSS of every running stage
+_active = set()
+_sampler_lock = threading.Lock()
+_sampler = None
+
+def _sample():
+    while True:
+        time.sleep(0.05)
+        with _sampler_lock:
+            stages = list(_active)
+        if stages:
+            current = rss()
+            for stage in stages:
+                stage.peak_rss = max(stage.peak_rss, current)
+
+def _track(stage):
+    global _sampler
+    with _sampler_lock:
+        _active.add(stage)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name='profiling', daemon=True)
+            _sampler.start()
+
+def _untrack(stage):
+    with _sampler_lock:
+        _active.discard(stage)
+
+class Stage:
+    def __init__(self, name, rows_in=None, **fields):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.fields = fields
+        self.record = None
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.started_at = datetime.now().isoformat(timespec='milliseconds')
+        self.start_rss = self.peak_rss = rss()
+        _track(self)
+        self.profiler = start_hot_path_profile(self.name) if self.depth == 0 and settings['profile'] else None
+        self.wall, self.cpu = time.perf_counter(), cpu_seconds()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.wall
+        cpu = cpu_seconds() - self.cpu
+        _untrack(self)
+        _local.stack.pop()
+        peak = max(self.peak_rss, rss())
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        self.record = {
+            'stage': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'started_at': self.started_at,
+            'seconds': seconds,
+            'cpu_seconds': cpu,
+            'peak_rss_mb': peak / 2 ** 20,
+            'rss_growth_mb': (peak - self.start_rss) / 2 ** 20,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_second': rows / seconds if rows and seconds else None,
+            'status': 'ok' if exc_type is None else 'error',
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            **self.fields,
+        }
+        if exc_type is not None:
+            self.record['error'] = f'{exc_type.__name__}: {exc}'
+        if self.profiler is not None:
+            self.record['profile_path'] = stop_hot_path_profile(self.profiler)
+        write_record(self.record)
+        return False
+
+# Context manager timing a block: with stage('clustering.apply_dbscan', rows_in=len(data)) as s: ...
+# and s.rows_out = len(result) inside it when the output size is known
+def stage(name, rows_in=None, **fields):
+    return Stage(name, rows_in, **fields)
+
+# Decorator form of stage. rows_in is called with the function's arguments and rows_out with
+# its result to count rows, e.g. @profiled('clustering.load_data', rows_out=len)
+def profiled(name, rows_in=None, rows_out=None):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, rows_in(*args, **kwargs) if rows_in else None) as current:
+                result = function(*args, **kwargs)
+                if rows_out:
+                    current.rows_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
+
+def write_record(record):
+    if settings['log_path']:
+        line = json.dumps(record, default=str)
+        with _log_lock:
+            directory = os.path.dirname(settings['log_path'])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(settings['log_path'], 'a') as f:
+                f.write(line + '\n')
+    for listener in list(_listeners):
+        listener(record)
+
+def profile_path(name, extension):
+    os.makedirs(settings['profile_dir'], exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    name = ''.join(c if c.isalnum() else '_' for c in name)
+    return os.path.join(settings['profile_dir'], f"{name}-{stamp}-{os.getpid()}{extension}")
+
+# cProfile only sees the calling thread; py-spy samples every thread and, with --subprocesses,
+# the worker processes
+def start_hot_path_profile(name):
+    if settings['profile'] == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process
+            return None
+        return ('cprofile', profiler, profile_path(name, '.prof'))
+    if settings['profile'] == 'py-spy' and shutil.which('py-spy'):
+        path = profile_path(name, '.speedscope.json')
+        process = subprocess.Popen(
+            ['py-spy', 'record', '--pid', str(os.getpid()), '--subprocesses', '--format', 'speedscope', '--output', path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        return ('py-spy', process, path)
+    return None
+
+def stop_hot_path_profile(profiler):
+    kind, handle, path = profiler
+    if kind == 'cprofile':
+        handle.disable()
+        handle.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(handle, stream=text).sort_stats('cumulative').print_stats(30)
+        with open(os.path.splitext(path)[0] + '.txt', 'w') as f:
+            f.write(text.getvalue())
+    else:
+        # py-spy writes its output when interrupted
+        handle.send_signal(signal.SIGINT)
+        try:
+            handle.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            handle.kill()
+    return path
+
+# One console line for a stage record, indented by nesting depth
+def format_record(record):
+    parts = [f"{record['seconds']:.2f}s", f"CPU {record['cpu_seconds']:.2f}s", f"peak RSS {record['peak_rss_mb']:.0f} MB"]
+    if record['rows_in'] is not None:
+        parts.append(f"{record['rows_in']:,} rows in")
+    if record['rows_out'] is not None:
+        parts.append(f"{record['rows_out']:,} rows out")
+    if record['rows_per_second']:
+        parts.append(f"{record['rows_per_second']:,.0f} rows/s")
+    line = f"{'  ' * record['depth']}{record['stage']}: {', '.join(parts)}"
+    if record['status'] != 'ok':
+        line += f" ({record.get('error', 'failed')})"
+    if record.get('profile_path'):
+        line += f", hot paths in {record['profile_path']}"
+    return line
+
+def read_log(log_path=None):
+    with open(log_path or settings['log_path']) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+# Totals per stage over the records of a log, slowest first
+def summarize(records):
+    return records.groupby('stage').agg(
+        runs=('stage', 'size'),
+        total_seconds=('seconds', 'sum'),
+        mean_seconds=('seconds', 'mean'),
+        max_seconds=('seconds', 'max'),
+        cpu_seconds=('cpu_seconds', 'sum'),
+        max_peak_rss_mb=('peak_rss_mb', 'max'),
+        rows_in=('rows_in', lambda rows: rows.sum(min_count=1)),
+        rows_out=('rows_out', lambda rows: rows.sum(min_count=1)),
+    ).sort_values('total_seconds', ascending=False).reset_index()
+
+# Summary of a profile log, e.g. python profiling.py profile.jsonl
+if __name__ == "__main__":
+    print(summarize(read_log(sys.argv[1] if len(sys.argv) > 1 else settings['log_path'] or 'profile.jsonl')).to_string(index=False, float_format=lambda value: f'{value:.2f}'))
@@ -0,0 +1,297 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.request import pathname2url
+import tkinter as tk
+from tkinter import ttk
+
+# Ad-hoc SQL results read a page at a time. A query runs on a read-only connection owned by a
+# thread of its own. Each page is its own statement, bounded with LIMIT/OFFSET and read to the
+# end, so a SELECT over millions of rows only ever holds a few pages and no statement is left
+# open between pages to hold the read lock that writers wait on.
+
+class PagedQuery:
+    def __init__(self, db_path, sql, page_size=500, timeout=60):
+        self.db_path = db_path
+        self.sql = sql
+        self.subquery = sql.strip().rstrip(';')
+        self.page_size = page_size
+        self.timeout = timeout
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sql')
+        self.conn = None
+        self.paged = True
+
+    # Run function(*args) on the query's thread and return its Future. A call still running
+    # after timeout seconds is interrupted.
+    def submit(self, function, *args):
+        return self.worker.submit(self.timed, function, *args)
+
+    def timed(self, function, *args):
+        if self.conn is None:
+            uri = 'file:' + pathname2url(os.path.abspath(self.db_path)) + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        timer = threading.Timer(self.timeout, self.interrupt) if self.timeout else None
+        if timer is not None:
+            timer.start()
+        try:
+            return function(*args)
+        except sqlite3.OperationalError as e:
+            if str(e) == 'interrupted' and timer is not None and timer.finished.is_set():
+                raise sqlite3.OperationalError(f'query timed out after {self.timeout}s') from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    # Safe from any thread; stops the statement running on the query's connection
+    def interrupt(self):
+        if self.conn is not None:
+            self.conn.interrupt()
+
+    # Column names, or [] for a statement that returns no rows. A statement that cannot be
+    # wrapped as a subquery (PRAGMA, EXPLAIN) is paged by running it again for each page.
+    def execute(self):
+        self.paged = True
+        try:
+            cursor = self.conn.execute(f"SELECT * FROM ({self.subquery}) LIMIT 0")
+        except sqlite3.OperationalError as e:
+            if str(e) == 'interrupted':
+                raise
+            self.paged = False
+            cursor = self.conn.execute(self.sql)
+        columns = [description[0] for description in cursor.description or []]
+        cursor.close()
+        return columns
+
+    # Rows of page index. The statement is finished before returning either way.
+    def fetch_page(self, index):
+        if self.paged:
+            return self.conn.execute(
+                f"SELECT * FROM ({self.subquery}) LIMIT ? OFFSET ?", (self.page_size, index * self.page_size)
+            ).fetchall()
+        cursor = self.conn.execute(self.sql)
+        try:
+            for _ in range(index):
+                if not cursor.fetchmany(self.page_size):
+                    return []
+            return cursor.fetchmany(self.page_size)
+        finally:
+            cursor.close()
+
+    # Total row count, by SQLite for a plain query and by streaming through the result otherwise
+    def count(self):
+        try:
+            return self.conn.execute(f"SELECT COUNT(*) FROM ({self.subquery})").fetchone()[0]
+        except sqlite3.OperationalError as e:
+            if str(e) == 'interrupted':
+                raise
+        cursor = self.conn.execute(self.sql)
+        total = 0
+        rows = cursor.fetchmany(10000)
+        while rows:
+            total += len(rows)
+            rows = cursor.fetchmany(10000)
+        cursor.close()
+        return total
+
+    def disconnect(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def close(self):
+        self.interrupt()
+        self.worker.submit(self.disconnect)
+        self.worker.shutdown(wait=False)
+
+# Treeview of a PagedQuery that only holds the rows in view. The scrollbar spans the counted
+# rows, or the rows read so far plus one page while the end is unknown, so scrolling to the
+# bottom reads on. At most max_pages pages are cached; pages scrolled back to are read again.
+# post(function, *args) must run a call on the Tk thread (JobExecutor.post does).
+class ResultViewer(ttk.Frame):
+    def __init__(self, master, post, log=print, on_error=None, page_size=500, max_pages=20, timeout=60):
+        super().__init__(master)
+        self.post = post
+        self.log = log
+        self.on_error = on_error
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.query = None
+        self.visible_rows = 20
+        self.reset()
+
+        self.tree = ttk.Treeview(self, show="headings", height=self.visible_rows)
+        self.scrollbar_y = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar_x = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(xscroll=self.scrollbar_x.set)
+        self.status_var = tk.StringVar()
+        controls = ttk.Frame(self)
+        ttk.Label(controls, textvariable=self.status_var).pack(side='left')
+        ttk.Button(controls, text="Stop", command=self.stop).pack(side='right')
+        ttk.Button(controls, text="Count Rows", command=self.count_rows).pack(side='right')
+
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar_y.grid(row=0, column=1, sticky='ns')
+        self.scrollbar_x.grid(row=1, column=0, sticky='ew')
+        controls.grid(row=2, column=0, columnspan=2, sticky='ew')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree.bind('<Configure>', self.resize)
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+
+    def reset(self):
+        self.pages = OrderedDict()
+        self.offset = 0
+        self.known_rows = 0
+        self.exhausted = False
+        self.total = None
+        self.loading = None
+        self.counting = False
+
+    def run(self, db_path, sql):
+        self.close()
+        self.reset()
+        self.tree.delete(*self.tree.get_children())
+        self.tree["columns"] = ()
+        self.query = PagedQuery(db_path, sql, self.page_size, self.timeout)
+        self.status_var.set("Running query...")
+        self.loading = 0
+        self.request(self.query.execute, self.started, 'loading')
+
+    # Run a query call on the query's thread; done(result) then runs on the Tk thread. flag
+    # names the attribute that marks the call as in flight.
+    def request(self, function, done, flag, *args):
+        query = self.query
+        future = query.submit(function, *args)
+        future.add_done_callback(lambda future: self.post(self.deliver, query, future, done, flag))
+
+    def deliver(self, query, future, done, flag):
+        # Results of a query that has since been replaced are dropped
+        if query is not self.query:
+            return
+        setattr(self, flag, None if flag == 'loading' else False)
+        try:
+            result = future.result()
+        except Exception as e:
+            self.status_var.set(f"Query stopped: {e}")
+            if self.on_error is not None:
+                self.on_error(e)
+            return
+        done(result)
+
+    def started(self, columns):
+        self.tree["columns"] = columns
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=100, stretch=tk.NO)
+        self.log("SQL command executed successfully.")
+        if not columns:
+            self.exhausted = True
+            self.total = 0
+            self.status_var.set("Statement returned no rows.")
+            return
+        self.show(0)
+
+    def page_arrived(self, index, rows):
+        self.pages[index] = rows
+        self.pages.move_to_end(index)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        self.known_rows = max(self.known_rows, index * self.page_size + len(rows))
+        if len(rows) < self.page_size:
+            self.exhausted = True
+            self.total = self.known_rows
+        self.show(self.offset)
+
+    def counted(self, total):
+        self.total = total
+        self.log(f"Query returns {total:,} rows.")
+        self.show(self.offset)
+
+    # Rows the scrollbar spans
+    def row_limit(self):
+        if self.total is not None:
+            return self.total
+        return self.known_rows + (0 if self.exhausted else self.page_size)
+
+    # Show the rows from offset on, reading the pages they are on first if needed
+    def show(self, offset):
+        limit = self.row_limit()
+        self.offset = max(0, min(offset, limit - self.visible_rows))
+        first_page = self.offset // self.page_size
+        end = min(self.offset + self.visible_rows, limit)
+        pages = range(first_page, max(end - 1, self.offset) // self.page_size + 1)
+        missing = [index for index in pages if index not in self.pages and not (self.exhausted and index * self.page_size >= self.known_rows)]
+        if missing:
+            if self.loading is None and self.query is not None:
+                self.loading = missing[0]
+                self.status_var.set(f"Reading rows from {missing[0] * self.page_size + 1:,}...")
+                self.request(self.query.fetch_page, partial(self.page_arrived, missing[0]), 'loading', missing[0])
+            self.update_scrollbar(limit)
+            return
+
+        rows = []
+        for index in pages:
+            if index in self.pages:
+                self.pages.move_to_end(index)
+                rows += self.pages[index]
+        start = self.offset - first_page * self.page_size
+        rows = rows[start:start + self.visible_rows]
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            self.tree.insert("", tk.END, values=row)
+        self.update_scrollbar(limit)
+        if rows:
+            of = f"{self.total:,}" if self.total is not None else f"{self.known_rows:,}+"
+            self.status_var.set(f"Rows {self.offset + 1:,}-{self.offset + len(rows):,} of {of}")
+        elif self.total == 0:
+            self.status_var.set("No rows.")
+
+    def update_scrollbar(self, limit):
+        if limit <= 0:
+            self.scrollbar_y.set(0, 1)
+        else:
+            self.scrollbar_y.set(self.offset / limit, min(1, (self.offset + self.visible_rows) / limit))
+
+    # Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units' or 'pages')
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            self.show(int(float(args[1]) * self.row_limit()))
+        elif args[0] == 'scroll':
+            self.scroll(int(args[1]) * (self.visible_rows if args[2] == 'pages' else 1))
+
+    def scroll(self, rows):
+        self.show(self.offset + rows)
+        return 'break'
+
+    # Show as many rows as fit in the tree's height
+    def resize(self, event):
+        rowheight = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        visible_rows = max(1, (event.height - 25) // rowheight)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            if self.tree["columns"]:
+                self.show(self.offset)
+
+    def count_rows(self):
+        if self.query is None or self.counting or self.total is not None:
+            return
+        self.counting = True
+        self.status_var.set("Counting rows...")
+        self.request(self.query.count, self.counted, 'counting')
+
+    def stop(self):
+        if self.query is not None and (self.loading is not None or self.counting):
+            self.query.interrupt()
+
+    def close(self):
+        if self.query is not None:
+            self.query.close()
+            self.query = None
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from anomalies import OnlineAnomalyScorer, robust_scores, score_series, trailing_median
+from crime_db import load_daily_counts
+from data_cleaning import DataCleaningPipeline
+from socrata_stub import generate_records
+
+BY = ['district']
+OPTIONS = {'window': 14, 'seasonal_weeks': 4, 'threshold': 1.5, 'min_count': 1}
+
+
+def ingest(db_path, n, start_date, days, seed, first_id):
+    records = generate_records(n, start_date=start_date, days=days, seed=seed)
+    for i, record in enumerate(records):
+        record['id'] = str(first_id + i)
+    pipeline = DataCleaningPipeline(db_path, beat_shapefile=None)
+    pipeline.update_database(pipeline.clean_data(pd.DataFrame(records)))
+
+
+def test_trailing_median_matches_a_rolling_median_per_series():
+    matrix = np.random.default_rng(0).poisson(5, size=(6, 90)).astype('float32')
+    median, mad = trailing_median(matrix, 14)
+    for row, series in zip(median, pd.DataFrame(matrix.T).items()):
+        expected = series[1].shift(1).rolling(14).median().to_numpy()
+        np.testing.assert_allclose(row, expected, equal_nan=True)
+    weekly, _ = trailing_median(matrix, 4, step=7)
+    expected = pd.Series(matrix[0]).shift(7).rolling(22).apply(lambda values: np.median(values[::7])).to_numpy()
+    np.testing.assert_allclose(weekly[0], expected, equal_nan=True)
+
+
+def test_score_series_ranks_an_injected_spike_first():
+    dates = pd.date_range('2023-01-01', periods=120, freq='D')
+    rng = np.random.default_rng(1)
+    counts = pd.DataFrame([
+        {'district': district, 'primary_type': crime_type, 'date': date, 'count': rng.poisson(8)}
+        for district in (1, 2, 3) for crime_type in ('THEFT', 'BATTERY') for date in dates
+    ])
+    spike = (counts['district'] == 2) & (counts['primary_type'] == 'BATTERY') & (counts['date'] == dates[100])
+    counts.loc[spike, 'count'] = 60
+    ranked = score_series(counts, ['district', 'primary_type'])
+    assert ranked.loc[0, ['district', 'primary_type', 'date', 'count']].tolist() == [2, 'BATTERY', dates[100], 60]
+
+    # The vectorised z-scores of every series match scoring that series on its own
+    z_rolling, z_seasonal, _ = robust_scores(counts.pivot_table('count', 'date', ['district', 'primary_type']).T.to_numpy('float32'))
+    single = counts[(counts['district'] == 3) & (counts['primary_type'] == 'THEFT')]
+    z_single, z_single_seasonal, _ = robust_scores(single['count'].to_numpy('float32')[None, :])
+    np.testing.assert_allclose(z_rolling[5], z_single[0], equal_nan=True)
+    np.testing.assert_allclose(z_seasonal[5], z_single_seasonal[0], equal_nan=True)
+
+
+def test_online_updates_match_scoring_the_full_history(tmp_path):
+    db_path = str(tmp_path / 'crimes.db')
+    ingest(db_path, 6000, '2023-01-01', 100, seed=1, first_id=10000000)
+    scorer = OnlineAnomalyScorer(db_path, by=BY, **OPTIONS)
+    scorer.update()
+    first_new_day = pd.Timestamp('2023-01-01') + pd.Timedelta(days=99)
+
+    # Two more ingests, each scored from the saved state only
+    ingest(db_path, 1200, '2023-04-11', 20, seed=2, first_id=20000000)
+    ranked = scorer.update()
+    ingest(db_path, 600, '2023-05-01', 10, seed=3, first_id=30000000)
+    ranked = pd.concat([ranked[ranked['date'] < pd.Timestamp('2023-04-30')], scorer.update()], ignore_index=True)
+
+    full = score_series(load_daily_counts(db_path, by=BY), BY, **OPTIONS)
+    full = full[full['date'] >= first_new_day]
+    assert len(full) > 0
+
+    columns = BY + ['date', 'count', 'score']
+    ordered = lambda frame: frame[columns].astype({'district': 'int64'}).sort_values(BY + ['date'], ignore_index=True)
+    pd.testing.assert_frame_equal(ordered(ranked), ordered(full), check_dtype=False, rtol=1e-5)
+
+
+def test_reset_forgets_the_saved_state(tmp_path):
+    db_path = str(tmp_path / 'crimes.db')
+    ingest(db_path, 2000, '2023-01-01', 80, seed=1, first_id=10000000)
+    scorer = OnlineAnomalyScorer(db_path, by=BY, **OPTIONS)
+    scorer.update()
+    assert scorer.load_state() is not None
+    scorer.reset()
+    assert scorer.load_state() is None
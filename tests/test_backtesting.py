@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtesting import backtest_summary, fold_errors, run_backtest
+from data_cleaning import DataCleaningPipeline
+from socrata_stub import generate_records
+
+CUTOFFS = ['2023-03-01', '2023-04-01']
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'crimes.db')
+    pipeline = DataCleaningPipeline(path, beat_shapefile=None)
+    pipeline.update_database(pipeline.clean_data(pd.DataFrame(generate_records(3000, days=120))))
+    return path
+
+
+def test_fold_errors_skip_days_without_incidents_in_mape():
+    actual = np.array([[2, 0, 4], [0, 0, 0]], dtype='float64')
+    predicted = np.array([[1, 1, 4], [1, 0, 0]], dtype='float64')
+    mae, rmse, mape = fold_errors(actual, predicted)
+    np.testing.assert_allclose(mae, [2 / 3, 1 / 3])
+    np.testing.assert_allclose(rmse, [np.sqrt(2 / 3), np.sqrt(1 / 3)])
+    assert mape[0] == pytest.approx(25.0) and np.isnan(mape[1])
+
+
+def test_stored_folds_are_skipped(db_path):
+    metrics = run_backtest(db_path, cutoffs=CUTOFFS[:1], horizon=7, n_jobs=1)
+    areas = metrics['series'].nunique()
+    assert len(metrics) == 2 * areas
+    assert set(metrics['backend']) == {'seasonal_naive', 'fourier_ridge'}
+
+    # Only the new cutoff runs
+    metrics = run_backtest(db_path, cutoffs=CUTOFFS, horizon=7, n_jobs=1)
+    assert set(metrics['cutoff']) == {'2023-04-01'}
+    assert run_backtest(db_path, cutoffs=CUTOFFS, horizon=7, n_jobs=1).empty
+
+    # A different horizon is a different fold, and rerun recomputes stored ones
+    assert len(run_backtest(db_path, cutoffs=CUTOFFS, horizon=14, n_jobs=1)) == 4 * areas
+    assert len(run_backtest(db_path, cutoffs=CUTOFFS, horizon=7, n_jobs=1, rerun=True)) == 4 * areas
+
+    summary = backtest_summary(db_path)
+    assert set(zip(summary['horizon'], summary['folds'])) == {(7, 2), (14, 2)}
+
+
+def test_cutoffs_without_enough_history_or_horizon_are_dropped(db_path):
+    metrics = run_backtest(db_path, cutoffs=['2023-01-05', '2023-02-01', '2023-04-28'], horizon=7, n_jobs=1)
+    assert set(metrics['cutoff']) == {'2023-02-01'}
+
+
+def test_parallel_folds_match_serial_ones(db_path):
+    columns = ['series', 'backend', 'cutoff', 'mae', 'rmse', 'mape']
+    serial = run_backtest(db_path, cutoffs=CUTOFFS, horizon=7, n_jobs=1)[columns]
+    parallel = run_backtest(db_path, cutoffs=CUTOFFS, horizon=7, n_jobs=2, rerun=True)[columns]
+    ordered = lambda frame: frame.sort_values(['backend', 'cutoff', 'series'], ignore_index=True)
+    pd.testing.assert_frame_equal(ordered(parallel), ordered(serial))
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from clustering_analysis import cluster_districts, summarize_clusters, top_crime_types
+
+
+# Two tight blobs in each of three districts plus scattered noise, in UTM metres
+def incidents():
+    rng = np.random.default_rng(0)
+    frames = []
+    for district, x in [(1, 0), (7, 5000), (12, 10000)]:
+        for y in (0, 3000):
+            frames.append(pd.DataFrame({'district': district, 'utm_x': x + rng.normal(0, 20, 40), 'utm_y': y + rng.normal(0, 20, 40)}))
+        frames.append(pd.DataFrame({'district': district, 'utm_x': x + 1000 + rng.random(5) * 1000, 'utm_y': 1000 + rng.random(5) * 1000}))
+    data = pd.concat(frames, ignore_index=True)
+    return data.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_cluster_ids_are_unique_across_districts():
+    data = incidents()
+    labels = cluster_districts(data, eps=100, min_samples=5, n_jobs=1)
+    clustered = data.assign(cluster=labels)[labels != -1]
+
+    # Six blobs, each its own cluster, and no cluster spans two districts
+    assert sorted(clustered['cluster'].unique()) == list(range(6))
+    assert (clustered.groupby('cluster')['district'].nunique() == 1).all()
+    assert (clustered.groupby('cluster').size() == 40).all()
+    assert (labels == -1).sum() == 15
+
+
+def test_parallel_clustering_matches_serial():
+    data = incidents()
+    np.testing.assert_array_equal(cluster_districts(data, 100, 5, n_jobs=3), cluster_districts(data, 100, 5, n_jobs=1))
+
+
+def test_summary_has_one_row_per_cluster():
+    data = incidents()
+    data['primary_type'] = pd.Categorical(np.where(data.index % 3 == 0, 'BATTERY', 'THEFT'))
+    data['latitude'], data['longitude'] = 41.8 + data['utm_y'] / 1e5, -87.7 + data['utm_x'] / 1e5
+    results = data.assign(cluster=cluster_districts(data, 100, 5, n_jobs=1))
+    results['top_crime_type'] = results['cluster'].map(top_crime_types(results))
+    summary = summarize_clusters(results)
+    assert len(summary) == 6
+    assert summary['size'].sum() == (results['cluster'] != -1).sum()
+    assert set(summary['top_crime_type']) == {'THEFT'}
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from crime_db import SCHEMA_VERSION, connect, connect_reader, count_by_day, load_crimes, load_daily_counts, schema_version
+from data_cleaning import DataCleaningPipeline
+from socrata_stub import generate_records
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'crimes.db')
+    pipeline = DataCleaningPipeline(path, beat_shapefile=None)
+    pipeline.update_database(pipeline.clean_data(pd.DataFrame(generate_records(100, days=10))))
+    return path
+
+
+def test_schema_is_created_once_in_wal_mode(db_path):
+    conn = connect(db_path)
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    conn.close()
+
+
+def test_reads_do_not_wait_for_an_open_write_transaction(db_path):
+    writer = sqlite3.connect(db_path)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("UPDATE crimes SET arrest = 1 - arrest")
+    try:
+        # Any DDL on the read path would need the lock the writer holds
+        reader = connect_reader(db_path)
+        reader.execute("PRAGMA busy_timeout = 0")
+        assert reader.execute("SELECT COUNT(*) FROM crimes").fetchone()[0] == 100
+        reader.close()
+        assert len(load_crimes(db_path, columns=['id', 'arrest'])) == 100
+        assert load_daily_counts(db_path)['count'].sum() == 100
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_reader_brings_an_older_file_up_to_date(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA user_version = 0")
+    conn.close()
+    reader = connect_reader(db_path)
+    assert schema_version(reader) == SCHEMA_VERSION
+    reader.close()
+
+
+@pytest.mark.skipif(hasattr(os, 'geteuid') and os.geteuid() == 0, reason='root can write any file')
+def test_read_only_file_can_be_read(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA user_version = 0")
+    conn.close()
+    os.chmod(db_path, 0o444)
+    try:
+        assert len(load_crimes(db_path, columns=['id'])) == 100
+    finally:
+        os.chmod(db_path, 0o644)
+
+
+# Groupings kept in daily_counts are summed from it, others are counted from crimes
+@pytest.mark.parametrize('by', [None, ['district', 'primary_type'], ['location_description']])
+def test_daily_counts_match_counting_the_incidents(db_path, by):
+    start, end = '2023-01-03', '2023-01-08'
+    crimes = load_crimes(db_path, columns=['timestamp'] + (by or []), start=start, end=end)
+    expected = count_by_day(crimes, by)
+    counted = load_daily_counts(db_path, start=start, end=end, by=by)
+    assert counted['count'].sum() == len(crimes) > 0
+    # Compared as text, since the two sides type the group columns differently
+    pd.testing.assert_frame_equal(counted.astype(str), expected.astype(str))
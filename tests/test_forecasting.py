@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+import time_series_analysis
+from forecasting import FourierRidgeBackend, SeasonalNaiveBackend, holiday_table
+from time_series_analysis import forecast_area, model_cache_key
+
+WEEKDAY_LEVELS = np.array([10, 12, 11, 13, 20, 25, 15], dtype='float32')
+
+
+def weekly_matrix(dates, scale=(1, 2)):
+    return np.array([WEEKDAY_LEVELS[dates.dayofweek] * factor for factor in scale], dtype='float32')
+
+
+def test_seasonal_naive_repeats_each_weekday():
+    dates = pd.date_range('2023-01-01', periods=70, freq='D')
+    future = pd.date_range('2023-03-12', periods=14, freq='D')
+    keys = pd.DataFrame({'area': ['North', 'South']})
+    predicted = SeasonalNaiveBackend().fit(keys, dates, weekly_matrix(dates)).predict(future)
+    np.testing.assert_allclose(predicted, weekly_matrix(future))
+
+
+def test_fourier_ridge_fits_every_series_at_once():
+    dates = pd.date_range('2022-01-01', periods=500, freq='D')
+    future = pd.date_range('2023-05-16', periods=28, freq='D')
+    keys = pd.DataFrame({'area': ['North', 'South']})
+    backend = FourierRidgeBackend(alpha=1e-6, holiday_dates=holiday_table([2022, 2023]).iloc[:0])
+    predicted = backend.fit(keys, dates, weekly_matrix(dates)).predict(future)
+    assert predicted.shape == (2, 28)
+    np.testing.assert_allclose(predicted, weekly_matrix(future), atol=0.05)
+
+
+def test_model_cache_key_follows_the_training_inputs():
+    daily = pd.DataFrame({'ds': pd.date_range('2023-01-01', periods=60, freq='D'), 'y': np.arange(60)})
+    holidays = holiday_table([2023])
+    key = model_cache_key('North', '2023-01-01', '2023-03-01', daily, holidays)
+    assert model_cache_key('North', '2023-01-01', '2023-03-01', daily.copy(), holidays.iloc[::-1]) == key
+
+    changed = daily.assign(y=daily['y'].where(daily.index != 30, 0))
+    assert model_cache_key('North', '2023-01-01', '2023-03-01', changed, holidays) != key
+    assert model_cache_key('South', '2023-01-01', '2023-03-01', daily, holidays) != key
+    assert model_cache_key('North', '2023-01-01', '2023-03-02', daily, holidays) != key
+    assert model_cache_key('North', '2023-01-01', '2023-03-01', daily, holidays.iloc[1:]) != key
+
+
+def test_cached_prophet_model_is_not_refitted(tmp_path, monkeypatch):
+    dates = pd.date_range('2023-01-01', periods=90, freq='D')
+    daily = pd.DataFrame({'ds': dates, 'y': weekly_matrix(dates)[0]})
+    future = pd.date_range('2023-04-01', periods=7, freq='D')
+    args = ('North', daily, holiday_table([2023]), '2023-01-01', '2023-03-31', future, str(tmp_path))
+    fitted = forecast_area(*args)
+    assert len(list(tmp_path.glob('*.json'))) == 1
+
+    class Unfittable:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError('a cached model was fitted again')
+
+    monkeypatch.setattr(time_series_analysis, 'Prophet', Unfittable)
+    cached = forecast_area(*args)
+    pd.testing.assert_series_equal(cached['yhat'], fitted['yhat'])
@@ -0,0 +1,142 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from crime_db import create_schema
+from data_cleaning import DataCleaningPipeline
+from socrata_stub import SocrataStub, generate_records
+
+DATASET = 'ijzp-q8t2'
+START, END = '2023-01-01T00:00:00', '2024-01-01T00:00:00'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'crimes.db')
+
+
+@pytest.fixture
+def pipeline(db_path):
+    return DataCleaningPipeline(db_path, beat_shapefile=None)
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    create_schema(conn)
+    yield conn
+    conn.close()
+
+
+def cleaned(pipeline, records):
+    return pipeline.clean_data(pd.DataFrame(records))
+
+
+def stored_daily_counts(conn):
+    return pd.read_sql_query(
+        "SELECT day, area, district, beat, primary_type_id, SUM(n) AS n FROM daily_counts "
+        "GROUP BY day, area, district, beat, primary_type_id ORDER BY day, area, district, beat, primary_type_id", conn
+    )
+
+
+def recounted_daily_counts(conn):
+    return pd.read_sql_query(
+        "SELECT timestamp / 86400 AS day, area, district, beat, primary_type_id, COUNT(*) AS n FROM crimes "
+        "WHERE timestamp IS NOT NULL GROUP BY day, area, district, beat, primary_type_id "
+        "ORDER BY day, area, district, beat, primary_type_id", conn
+    )
+
+
+def test_upsert_counts_inserted_updated_and_unchanged_rows(pipeline, conn):
+    records = generate_records(50)
+    assert pipeline.upsert_records(conn, cleaned(pipeline, records)) == {'inserted': 50, 'updated': 0}
+
+    # The same rows again change nothing
+    assert pipeline.upsert_records(conn, cleaned(pipeline, records)) == {'inserted': 0, 'updated': 0}
+
+    # Three changed rows and five new ones
+    changed = [dict(record) for record in records]
+    for record in changed[:3]:
+        record['primary_type'] = 'ARSON'
+    changed += generate_records(55)[50:]
+    assert pipeline.upsert_records(conn, cleaned(pipeline, changed)) == {'inserted': 5, 'updated': 3}
+
+    assert conn.execute("SELECT COUNT(*) FROM crimes").fetchone()[0] == 55
+    arson = conn.execute("SELECT COUNT(*) FROM crimes JOIN primary_types ON primary_types.id = primary_type_id WHERE name = 'ARSON'").fetchone()[0]
+    assert arson == 3
+
+
+def test_daily_counts_follow_upserts_that_move_timestamps(pipeline, conn):
+    records = generate_records(200, days=30)
+    pipeline.upsert_records(conn, cleaned(pipeline, records))
+    pd.testing.assert_frame_equal(stored_daily_counts(conn), recounted_daily_counts(conn))
+
+    # Move some incidents three days later and others to another district, so both the days
+    # they leave and the days they land on must be recounted
+    moved = [dict(record) for record in records[:40]]
+    for record in moved[:20]:
+        timestamp = pd.Timestamp(record['date']) + pd.Timedelta(days=3)
+        record['date'] = timestamp.strftime('%Y-%m-%dT%H:%M:%S.000')
+    for record in moved[20:]:
+        record['district'] = '025' if record['district'] != '025' else '001'
+    assert pipeline.upsert_records(conn, cleaned(pipeline, moved)) == {'inserted': 0, 'updated': 40}
+
+    pd.testing.assert_frame_equal(stored_daily_counts(conn), recounted_daily_counts(conn))
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_stream_ingest_resumes_from_checkpoint(db_path):
+    with SocrataStub(generate_records(250)) as stub:
+        pipeline = DataCleaningPipeline(db_path, domain=stub.domain, uri_prefix='http://', beat_shapefile=None)
+
+        # Fail after the second page has been written and checkpointed
+        def fail_after_two_pages(counts):
+            if counts['inserted'] >= 100:
+                raise Interrupted()
+
+        with pytest.raises(Interrupted):
+            pipeline.stream_ingest(DATASET, START, END, page_size=50, progress=fail_after_two_pages)
+
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM crimes").fetchone()[0] == 100
+        assert conn.execute("SELECT COUNT(*) FROM ingest_checkpoints").fetchone()[0] == 1
+        conn.close()
+
+        # The rerun starts after the checkpoint: three full pages and the final empty one
+        requests_before = stub.request_count
+        counts = pipeline.stream_ingest(DATASET, START, END, page_size=50)
+        assert counts == {'inserted': 150, 'updated': 0}
+        assert stub.request_count - requests_before == 4
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM crimes").fetchone()[0] == 250
+    assert conn.execute("SELECT COUNT(*) FROM ingest_checkpoints").fetchone()[0] == 0
+    pd.testing.assert_frame_equal(stored_daily_counts(conn), recounted_daily_counts(conn))
+    conn.close()
+
+
+def test_revalidate_beats_moves_rows_into_their_polygon(tmp_path, pipeline, conn, db_path):
+    gpd = pytest.importorskip('geopandas')
+    shapely = pytest.importorskip('shapely')
+    pipeline.upsert_records(conn, cleaned(pipeline, generate_records(200, days=30)))
+
+    # One beat covering the western half of the stub's points
+    shapefile = str(tmp_path / 'beats.shp')
+    west = shapely.box(-87.85, 41.65, -87.70, 42.00)
+    gpd.GeoDataFrame({'beat_num': ['1111'], 'district': ['11']}, geometry=[west], crs='EPSG:4326').to_file(shapefile)
+    expected = conn.execute(
+        "SELECT COUNT(*) FROM crimes WHERE longitude <= -87.70 AND (beat IS NOT 1111 OR district IS NOT 11)"
+    ).fetchone()[0]
+
+    revalidating = DataCleaningPipeline(db_path, beat_shapefile=shapefile)
+    assert revalidating.revalidate_beats(chunksize=64) == expected
+    assert conn.execute("SELECT COUNT(*) FROM crimes WHERE longitude < -87.70 AND (beat != 1111 OR district != 11)").fetchone()[0] == 0
+    assert conn.execute("SELECT DISTINCT area FROM crimes WHERE beat = 1111").fetchall() == [('Area North',)]
+    pd.testing.assert_frame_equal(stored_daily_counts(conn), recounted_daily_counts(conn))
+
+    # Nothing is left to move
+    assert revalidating.revalidate_beats() == 0
@@ -0,0 +1,62 @@
+import time
+
+import pandas as pd
+import pytest
+
+from crime_db import load_crimes
+from data_cleaning import DataCleaningPipeline
+from job_executor import JobExecutor
+from socrata_stub import SocrataStub, generate_records
+from sql_viewer import PagedQuery
+
+DATASET = 'ijzp-q8t2'
+START, END = '2023-01-01T00:00:00', '2024-01-01T00:00:00'
+
+
+# Stands in for the Tk root: the test drains the executor's queue itself
+class FakeRoot:
+    def after(self, ms, function):
+        pass
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'crimes.db')
+    pipeline = DataCleaningPipeline(path, beat_shapefile=None)
+    pipeline.update_database(pipeline.clean_data(pd.DataFrame(generate_records(200))))
+    return path
+
+
+def test_ingest_runs_alongside_readers_of_the_same_database(db_path):
+    lines, results = [], {}
+    executor = JobExecutor(FakeRoot(), log=lines.append, max_workers=2)
+    viewer = PagedQuery(db_path, "SELECT id, arrest FROM crimes ORDER BY id", page_size=50)
+    try:
+        viewer.submit(viewer.execute).result()
+        assert len(viewer.submit(viewer.fetch_page, 0).result()) == 50
+
+        with SocrataStub(generate_records(2000)) as stub:
+            pipeline = DataCleaningPipeline(db_path, domain=stub.domain, uri_prefix='http://', beat_shapefile=None)
+            executor.submit('Ingest', lambda job: pipeline.stream_ingest(DATASET, START, END, page_size=100),
+                            on_done=lambda counts: results.update(ingest=counts))
+            executor.submit('Load', lambda job: [len(load_crimes(db_path, columns=['id', 'datetime'])) for _ in range(10)],
+                            on_done=lambda sizes: results.update(load=sizes))
+
+            deadline = time.monotonic() + 60
+            page = 1
+            while executor.jobs and time.monotonic() < deadline:
+                # The viewer keeps reading while both jobs run
+                viewer.submit(viewer.fetch_page, page % 4).result()
+                page += 1
+                executor.poll()
+                time.sleep(0.01)
+            executor.poll()
+    finally:
+        viewer.close()
+        executor.shutdown()
+
+    assert not executor.jobs
+    assert results['ingest'] == {'inserted': 1800, 'updated': 0}
+    assert all(200 <= size <= 2000 for size in results['load'])
+    assert not [line for line in lines if 'failed' in line or 'locked' in line]
+    assert len(load_crimes(db_path, columns=['id'])) == 2000
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from data_cleaning import DataCleaningPipeline
+from model_registry import ModelRegistry
+from socrata_stub import generate_records
+
+SELECTED_VARS = ['primary_type', 'location_description', 'latitude', 'longitude']
+START, END = '2023-01-01', '2023-03-01'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'crimes.db')
+    pipeline = DataCleaningPipeline(path, beat_shapefile=None)
+    pipeline.update_database(pipeline.clean_data(pd.DataFrame(generate_records(300, days=90))))
+    return path
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / 'models'))
+
+
+def model_key(registry, db_path):
+    return registry.model_key(db_path, SELECTED_VARS, START, END, 'smote')
+
+
+def edit(db_path, *statements):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        for statement in statements:
+            conn.execute(statement)
+    conn.close()
+
+
+# Two incidents in the training window with different primary types, and those types
+def swap_pair(db_path):
+    conn = sqlite3.connect(db_path)
+    pair = conn.execute(
+        "SELECT a.id, b.id, a.primary_type_id, b.primary_type_id FROM crimes a JOIN crimes b ON a.primary_type_id < b.primary_type_id "
+        "WHERE a.timestamp < strftime('%s', '2023-03-01') AND b.timestamp < strftime('%s', '2023-03-01') LIMIT 1"
+    ).fetchone()
+    conn.close()
+    return pair
+
+
+def test_saved_model_is_reused_for_unchanged_data(registry, db_path):
+    key = model_key(registry, db_path)
+    assert registry.load(key) is None
+    registry.save(key, {'trained': True}, {'selected_vars': SELECTED_VARS})
+
+    assert model_key(registry, db_path) == key
+    model, meta = registry.load(key)
+    assert model == {'trained': True} and meta['key'] == key
+    assert len(registry.versions()) == 1
+
+
+def test_rows_outside_the_window_do_not_change_the_key(registry, db_path):
+    key = model_key(registry, db_path)
+    edit(db_path, "UPDATE crimes SET arrest = 1 - arrest WHERE timestamp >= strftime('%s', '2023-03-01')")
+    assert model_key(registry, db_path) == key
+
+
+def test_swapped_values_invalidate_the_saved_model(registry, db_path):
+    key = model_key(registry, db_path)
+    registry.save(key, {'trained': True}, {})
+    first, second, first_type, second_type = swap_pair(db_path)
+
+    # Counts and sums of every column stay the same
+    edit(db_path,
+         f"UPDATE crimes SET primary_type_id = {second_type} WHERE id = {first}",
+         f"UPDATE crimes SET primary_type_id = {first_type} WHERE id = {second}")
+
+    swapped = model_key(registry, db_path)
+    assert swapped != key
+    assert registry.load(swapped) is None
+
+
+def test_same_length_description_edit_invalidates_the_saved_model(registry, db_path):
+    key = model_key(registry, db_path)
+    first = swap_pair(db_path)[0]
+    edit(db_path, f"UPDATE crimes SET description = 'SIMPLY' WHERE id = {first}")
+    assert model_key(registry, db_path) != key
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from data_cleaning import DataCleaningPipeline
+from socrata_stub import generate_records
+from sql_viewer import PagedQuery
+
+# Counts to a billion, far longer than any test waits
+ENDLESS = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000000) SELECT SUM(i) FROM n"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'crimes.db')
+    pipeline = DataCleaningPipeline(path, beat_shapefile=None)
+    pipeline.update_database(pipeline.clean_data(pd.DataFrame(generate_records(120))))
+    return path
+
+
+@pytest.fixture
+def query(db_path):
+    queries = []
+
+    def open_query(sql, **options):
+        queries.append(PagedQuery(db_path, sql, **options))
+        return queries[-1]
+
+    yield open_query
+    for query in queries:
+        query.close()
+
+
+def test_pages_split_the_result_in_order(query, db_path):
+    paged = query("SELECT id FROM crimes ORDER BY id;", page_size=50)
+    assert paged.submit(paged.execute).result() == ['id']
+    pages = [paged.submit(paged.fetch_page, index).result() for index in (2, 0, 1, 3)]
+    assert [len(page) for page in pages] == [20, 50, 50, 0]
+    conn = sqlite3.connect(db_path)
+    ids = [row[0] for row in conn.execute("SELECT id FROM crimes ORDER BY id")]
+    conn.close()
+    assert [row[0] for row in pages[1] + pages[2] + pages[0]] == ids
+    assert paged.submit(paged.count).result() == 120
+
+
+def test_statements_that_cannot_be_wrapped_are_paged_too(query):
+    paged = query("PRAGMA table_info(crimes)", page_size=5)
+    assert 'name' in paged.submit(paged.execute).result()
+    assert not paged.paged
+    assert len(paged.submit(paged.fetch_page, 0).result()) == 5
+    assert paged.submit(paged.count).result() > 5
+
+
+# Also without WAL, where an unfinished statement would hold a lock that every writer waits on
+@pytest.mark.parametrize('journal_mode', ['wal', 'delete'])
+def test_an_open_page_does_not_block_writers(query, db_path, journal_mode):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.close()
+    paged = query("SELECT * FROM crimes", page_size=10)
+    paged.submit(paged.execute).result()
+    assert len(paged.submit(paged.fetch_page, 0).result()) == 10
+
+    writer = sqlite3.connect(db_path, timeout=0)
+    with writer:
+        writer.execute("UPDATE crimes SET arrest = 1 - arrest")
+    writer.close()
+    assert len(paged.submit(paged.fetch_page, 1).result()) == 10
+
+
+def test_slow_query_times_out(query):
+    paged = query(ENDLESS, timeout=0.2)
+    with pytest.raises(sqlite3.OperationalError, match='timed out'):
+        paged.submit(paged.count).result()
+
+
+def test_interrupt_stops_a_running_query(query):
+    paged = query(ENDLESS, timeout=None)
+    paged.submit(paged.execute).result()
+    future = paged.submit(paged.fetch_page, 0)
+    threading.Timer(0.2, paged.interrupt).start()
+    with pytest.raises(sqlite3.OperationalError, match='interrupted'):
+        future.result(timeout=30)
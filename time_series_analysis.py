@@ -1,8 +1,14 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
-import sqlite3
+from crime_db import load_daily_counts
+from profiling import profiled, stage
+import prophet
 from prophet import Prophet
+from prophet.serialize import model_from_json, model_to_json
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import holidays
 import seaborn as sns
@@ -11,34 +17,56 @@ import matplotlib.dates as mdates
 # Set the Seaborn theme
 sns.set_theme(style="whitegrid")
 
-def fetch_data_from_db(db_path, query):
-    conn = sqlite3.connect(db_path)
-    data = pd.read_sql_query(query, conn)
-    conn.close()
-    return data
-
-def run_time_series_analysis(db_path):
+# Fitted Prophet models, one JSON file per area and input
+MODEL_CACHE_DIR = os.path.join('.cache', 'prophet')
+
+# Cache key for a model: the area, the training window, the daily series and the holidays it was
+# fitted on, and the Prophet version that wrote it
+def model_cache_key(area, train_start, train_end, area_train_daily, holiday_dates):
+    digest = hashlib.sha256()
+    digest.update(f'{area}|{train_start}|{train_end}|{prophet.__version__}'.encode())
+    digest.update(area_train_daily['ds'].to_numpy(dtype='datetime64[ns]').tobytes())
+    digest.update(area_train_daily['y'].to_numpy(dtype='int64').tobytes())
+    digest.update(holiday_dates.sort_values(['ds', 'holiday']).to_csv(index=False).encode())
+    return digest.hexdigest()[:32]
+
+def model_cache_path(area, train_start, train_end, area_train_daily, holiday_dates, cache_dir=MODEL_CACHE_DIR):
+    return os.path.join(cache_dir, f'{model_cache_key(area, train_start, train_end, area_train_daily, holiday_dates)}.json')
+
+# Fit (or load from the cache) the Prophet model for one area and forecast the future dates.
+# Runs in a worker process, so everything it needs is passed in.
+def forecast_area(area, area_train_daily, holiday_dates, train_start, train_end, future_dates, cache_dir=MODEL_CACHE_DIR):
+    cache_path = model_cache_path(area, train_start, train_end, area_train_daily, holiday_dates, cache_dir)
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            prophet_model = model_from_json(f.read())
+    else:
+        # Initialize and fit the Prophet model
+        prophet_model = Prophet(holidays=holiday_dates)
+        prophet_model.fit(area_train_daily)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(model_to_json(prophet_model))
+        os.replace(temp_path, cache_path)
+
+    # Make predictions
+    return prophet_model.predict(pd.DataFrame(future_dates, columns=['ds']))
+
+# daily_counts: per-area daily counts already loaded (as load_daily_counts(by=['area']) returns
+# them), used instead of reading the database
+@profiled('time_series.run')
+def run_time_series_analysis(db_path, n_jobs=None, cache_dir=MODEL_CACHE_DIR, daily_counts=None):
     figures = []
-    
-    # Fetch the data for training (2014-2023)
-    query_train = """
-    SELECT *
-    FROM crimes
-    WHERE date BETWEEN '2014-01-01' AND '2023-12-31'
-    """
-    crime_data_train = fetch_data_from_db(db_path, query_train)
-
-    # Fetch the data for validation (2024)
-    query_validate = """
-    SELECT *
-    FROM crimes
-    WHERE date BETWEEN '2024-01-01' AND '2024-06-28'
-    """
-    crime_data_validate = fetch_data_from_db(db_path, query_validate)
-
-    # Ensure the date column is in datetime format
-    crime_data_train['date'] = pd.to_datetime(crime_data_train['date'])
-    crime_data_validate['date'] = pd.to_datetime(crime_data_validate['date'])
+    train_start, train_end = '2014-01-01', '2024-01-01'
+
+    # Daily crime counts per area for training (2014-2023), counted in SQL
+    with stage('time_series.load') as current:
+        if daily_counts is None:
+            crime_data_train = load_daily_counts(db_path, start=train_start, end=train_end, by=['area'])
+        else:
+            crime_data_train = daily_counts[(daily_counts['date'] >= train_start) & (daily_counts['date'] < train_end)]
+        current.rows_out = len(crime_data_train)
 
     # Generate US holidays
     us_holidays = holidays.US(state='IL')
@@ -48,44 +76,56 @@ def run_time_series_analysis(db_path):
     holiday_dates['ds'] = pd.to_datetime(holiday_dates['ds'])
 
     # Get the unique areas from the dataset and filter out the 'None' area
-    unique_areas = [area for area in crime_data_train['area'].unique() if area]
+    unique_areas = [area for area in crime_data_train['area'].dropna().unique() if area]
 
     # Define colors for each area
     colors = sns.color_palette('husl', n_colors=len(unique_areas))
     forecast_color = 'black'  # Color for forecasted data
 
-    # Initialize lists to store combined data
-    combined_area_data = []
-    combined_forecast_data = []
-
-    # Loop through each area
-    for i, area in enumerate(unique_areas):
-        # Filter the data by area
-        area_train_data = crime_data_train[crime_data_train['area'] == area]
-        area_validate_data = crime_data_validate[crime_data_validate['area'] == area]
+    # Create future dataframe to hold the dates for which we want a forecast
+    future_dates = pd.date_range(start='2024-01-01', end='2024-12-31', freq='D')
 
-        # Prepare the data for Prophet
-        area_train_daily = area_train_data.groupby(area_train_data['date'].dt.date).size().reset_index(name='count')
+    # Prepare the data for Prophet
+    area_train_series = {}
+    for area in unique_areas:
+        area_train_daily = crime_data_train[crime_data_train['area'] == area][['date', 'count']]
         area_train_daily.columns = ['ds', 'y']
 
         # Check if there is enough data to fit the model
         if area_train_daily.shape[0] < 2:
             print(f"Not enough data to train the model for area: {area}")
             continue
+        area_train_series[area] = area_train_daily.reset_index(drop=True)
+
+    # Areas with a cached model are loaded here; only the ones left to fit go to a process pool,
+    # so a fully cached run starts no workers
+    to_fit = [
+        area for area, daily in area_train_series.items()
+        if not os.path.exists(model_cache_path(area, train_start, train_end, daily, holiday_dates, cache_dir))
+    ]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(to_fit)) or 1
+    with stage('time_series.fit', rows_in=sum(map(len, area_train_series.values())), areas=len(area_train_series), fitted=len(to_fit), n_jobs=n_jobs) as current:
+        if n_jobs == 1:
+            fitted = {area: forecast_area(area, area_train_series[area], holiday_dates, train_start, train_end, future_dates, cache_dir) for area in to_fit}
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = {
+                    area: executor.submit(forecast_area, area, area_train_series[area], holiday_dates, train_start, train_end, future_dates, cache_dir)
+                    for area in to_fit
+                }
+                fitted = {area: future.result() for area, future in futures.items()}
+        forecasts = {
+            area: fitted[area] if area in fitted else forecast_area(area, daily, holiday_dates, train_start, train_end, future_dates, cache_dir)
+            for area, daily in area_train_series.items()
+        }
+        current.rows_out = sum(map(len, forecasts.values()))
 
-        # Convert ds column to datetime
-        area_train_daily['ds'] = pd.to_datetime(area_train_daily['ds'])
-
-        # Initialize and fit the Prophet model
-        prophet_model = Prophet(holidays=holiday_dates)
-        prophet_model.fit(area_train_daily)
-
-        # Create future dataframe to hold the dates for which we want a forecast
-        future_dates = pd.date_range(start='2024-01-01', end='2024-12-31', freq='D')
-        future = pd.DataFrame(future_dates, columns=['ds'])
+    # Initialize lists to store combined data
+    combined_area_data = []
+    combined_forecast_data = []
 
-        # Make predictions
-        forecast = prophet_model.predict(future)
+    for area, area_train_daily in area_train_series.items():
+        forecast = forecasts[area]
 
         # Add area identifier
         area_train_daily['area'] = area
@@ -99,8 +139,10 @@ def run_time_series_analysis(db_path):
     combined_area_data = pd.concat(combined_area_data)
     combined_forecast_data = pd.concat(combined_forecast_data)
 
+    # Figures are built without pyplot so the analysis can run off the GUI thread
     # Plot the forecast with trend line from 2014 to 2024 for each area
-    fig1, ax1 = plt.subplots(figsize=(10, 4))  # Reduced size
+    fig1 = Figure(figsize=(10, 4))  # Reduced size
+    ax1 = fig1.subplots()
 
     # Plot historical and forecasted values with trend line for each area
     for i, area in enumerate(unique_areas):
@@ -114,7 +156,7 @@ def run_time_series_analysis(db_path):
     ax1.xaxis.set_major_locator(mdates.YearLocator())
     ax1.xaxis.set_minor_locator(mdates.MonthLocator())
     ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-    plt.xticks(rotation=45)
+    ax1.tick_params(axis='x', labelrotation=45)
 
     ax1.set_title('Historical and Forecasted Crimes by Area (2014-2024)')
     ax1.set_xlabel('Date')
@@ -122,19 +164,20 @@ def run_time_series_analysis(db_path):
     ax1.legend()
     ax1.grid(True, which='both', linestyle='--', linewidth=0.5)
 
-    plt.tight_layout()
+    fig1.tight_layout()
     figures.append(fig1)
 
     # Plot the actual monthly crime counts for each area
-    fig2, ax2 = plt.subplots(figsize=(10, 4))  # Reduced size
+    fig2 = Figure(figsize=(10, 4))  # Reduced size
+    ax2 = fig2.subplots()
 
     # Calculate month-over-month changes and aggregate monthly crime data for each area
     for i, area in enumerate(unique_areas):
         area_train_daily = combined_area_data[combined_area_data['area'] == area]
         forecast = combined_forecast_data[combined_forecast_data['area'] == area]
 
-        area_train_daily['month'] = area_train_daily['ds'].dt.to_period('M')
-        forecast['month'] = forecast['ds'].dt.to_period('M')
+        area_train_daily = area_train_daily.assign(month=area_train_daily['ds'].dt.to_period('M'))
+        forecast = forecast.assign(month=forecast['ds'].dt.to_period('M'))
 
         monthly_crime_data = area_train_daily.groupby('month')['y'].sum().reset_index(name='monthly_count')
         monthly_forecast_data = forecast.groupby('month')['yhat'].sum().reset_index(name='monthly_count')
@@ -151,7 +194,7 @@ def run_time_series_analysis(db_path):
     ax2.xaxis.set_major_locator(mdates.YearLocator())
     ax2.xaxis.set_minor_locator(mdates.MonthLocator())
     ax2.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-    plt.xticks(rotation=45)
+    ax2.tick_params(axis='x', labelrotation=45)
 
     ax2.set_title('Monthly Crime Counts by Area (2014-2024)')
     ax2.set_xlabel('Month')
@@ -159,7 +202,7 @@ def run_time_series_analysis(db_path):
     ax2.legend()
     ax2.grid(True, which='both', linestyle='--', linewidth=0.5)
 
-    plt.tight_layout()
+    fig2.tight_layout()
     figures.append(fig2)
 
     return figures
@@ -167,5 +210,5 @@ def run_time_series_analysis(db_path):
 if __name__ == "__main__":
     db_path = 'TEST.db'  # Default database path
     figures = run_time_series_analysis(db_path)
-    for fig in figures:
-        fig.show()
+    for i, fig in enumerate(figures, start=1):
+        fig.savefig(f'time_series_{i}.png')